@@ -0,0 +1,267 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+ChapterInfo = dict[str, int | str]
+
+
+class ChapterCatalog:
+    """ The chapter info of a novel, indexed by name_index, URL and title
+
+    Stored in an SQLite database next to metadata.json. Chapter titles aren't unique, so title lookups return
+    every match. A novel whose metadata.json still has a chapter_info list is imported on first open.
+
+    Each chapter also has the word count of its parsed text, which isn't part of the chapter info, and the
+    potential spelling errors last found in it.
+    """
+    FILENAME = 'catalog.sqlite'
+    COLUMNS = ('name_index', 'url', 'chapter_title')
+
+    def __init__(self, novel_dir: Path):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.novel_dir = novel_dir
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(novel_dir / self.FILENAME, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS chapters (
+                    name_index INTEGER PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    chapter_title TEXT NOT NULL DEFAULT '',
+                    word_count INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(chapters)")]
+            if 'word_count' not in columns:
+                self._db.execute("ALTER TABLE chapters ADD COLUMN word_count INTEGER NOT NULL DEFAULT 0")
+            self._db.execute("CREATE INDEX IF NOT EXISTS chapters_url ON chapters (url)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS chapters_title ON chapters (chapter_title)")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS spelling_errors (
+                    name_index INTEGER PRIMARY KEY,
+                    content_key TEXT NOT NULL,
+                    error_count INTEGER NOT NULL,
+                    errors TEXT NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS spelling_errors_count ON spelling_errors (error_count)")
+
+        self._import_metadata()
+
+    def _import_metadata(self):
+        metadata_fp = self.novel_dir / 'metadata.json'
+        if not metadata_fp.exists():
+            return
+
+        with open(metadata_fp, 'r') as metadata_file:
+            metadata = json.load(metadata_file)
+        if 'chapter_info' not in metadata:
+            return
+
+        self.log.info(f"Importing chapter info for '{metadata['title']}' into the catalog")
+        self.replace_all(metadata.pop('chapter_info'))
+        with open(metadata_fp, 'w') as metadata_file:
+            json.dump(metadata, metadata_file, indent=2)
+
+    def _query(self, sql, params=()) -> list[ChapterInfo]:
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [dict(zip(self.COLUMNS, row)) for row in rows]
+
+    def chapter_info(self) -> list[ChapterInfo]:
+        return self._query("SELECT name_index, url, chapter_title FROM chapters ORDER BY name_index")
+
+    def get(self, name_index: int) -> ChapterInfo | None:
+        rows = self._query("SELECT name_index, url, chapter_title FROM chapters WHERE name_index = ?", (name_index,))
+        return rows[0] if rows else None
+
+    def by_url(self, url: str) -> ChapterInfo | None:
+        rows = self._query("SELECT name_index, url, chapter_title FROM chapters WHERE url = ?", (url,))
+        return rows[0] if rows else None
+
+    def by_title(self, chapter_title: str) -> list[ChapterInfo]:
+        return self._query("SELECT name_index, url, chapter_title FROM chapters WHERE chapter_title = ? "
+                           "ORDER BY name_index", (chapter_title,))
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chapters").fetchone()[0]
+
+    def word_count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(word_count), 0) FROM chapters").fetchone()[0]
+
+    def replace_all(self, chapter_data: list[ChapterInfo]):
+        """ Make chapter_data the chapter list, keeping the word counts of chapters still at the same URL """
+        with self._lock, self._db:
+            known = {row[0] for row in self._db.execute("SELECT name_index FROM chapters")}
+            gone = known - {info['name_index'] for info in chapter_data}
+            self._db.executemany("DELETE FROM chapters WHERE name_index = ?", [(i,) for i in gone])
+            self._db.executemany("""
+                INSERT INTO chapters (name_index, url, chapter_title) VALUES (?, ?, ?)
+                ON CONFLICT (name_index) DO UPDATE SET
+                    word_count = CASE WHEN url = excluded.url THEN word_count ELSE 0 END,
+                    url = excluded.url,
+                    chapter_title = excluded.chapter_title
+            """, [(info['name_index'], info['url'], info['chapter_title']) for info in chapter_data])
+
+    def set_parsed(self, parsed: dict[int, tuple[str, int]]):
+        """ Update the title and word count of several chapters in one transaction """
+        with self._lock, self._db:
+            self._db.executemany("UPDATE chapters SET chapter_title = ?, word_count = ? WHERE name_index = ?",
+                                 [(title, word_count, name_index)
+                                  for name_index, (title, word_count) in parsed.items()])
+
+    def errors(self, name_index: int, content_key: str) -> list[tuple[int, int]] | None:
+        """ Get the stored potential errors of a chapter, or None if they were found for different content """
+        with self._lock:
+            row = self._db.execute("SELECT content_key, errors FROM spelling_errors WHERE name_index = ?",
+                                   (name_index,)).fetchone()
+        if row is None or row[0] != content_key:
+            return None
+        return [tuple(error) for error in json.loads(row[1])]
+
+    def error_keys(self) -> dict[int, str]:
+        with self._lock:
+            return dict(self._db.execute("SELECT name_index, content_key FROM spelling_errors").fetchall())
+
+    def set_errors(self, errors: dict[int, tuple[str, list[tuple[int, int]]]]):
+        """ Store the potential errors of several chapters, along with the key of the content they were found for """
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO spelling_errors VALUES (?, ?, ?, ?)",
+                                 [(name_index, content_key, len(chapter_errors), json.dumps(chapter_errors))
+                                  for name_index, (content_key, chapter_errors) in errors.items()])
+
+    def most_errors(self, limit: int = 10) -> list[tuple[ChapterInfo, int]]:
+        """ The chapters with the most potential errors, as of when each was last checked """
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT chapters.name_index, url, chapter_title, error_count
+                FROM spelling_errors JOIN chapters USING (name_index)
+                ORDER BY error_count DESC, chapters.name_index
+                LIMIT ?
+            """, (limit,)).fetchall()
+        return [(dict(zip(self.COLUMNS, row[:3])), row[3]) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_catalogs: dict[Path, ChapterCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_chapter_catalog(novel_dir: Path) -> ChapterCatalog:
+    """ Get the shared catalog for a novel """
+    with _catalogs_lock:
+        if novel_dir not in _catalogs:
+            _catalogs[novel_dir] = ChapterCatalog(novel_dir)
+        return _catalogs[novel_dir]
+
+
+class LibraryCatalog:
+    """ A summary of every novel in the library, for listing novels without opening each one
+
+    Stored in library.sqlite in the novels directory. refresh() only re-reads a novel when the modification
+    time of its metadata.json or chapter catalog has changed since it was last summarised. The directory and
+    the catalog's -wal and -shm files aren't watched, since just opening the catalog to summarise it creates
+    and deletes them. Scrapes rewrite metadata.json when they finish, after their changes to the catalog.
+    """
+    FILENAME = 'library.sqlite'
+    COLUMNS = ('dir_name', 'title', 'chapter_count', 'word_count', 'last_chapter_scrape_ts')
+    WATCHED_FILES = ('metadata.json', ChapterCatalog.FILENAME)
+
+    def __init__(self, novels_dir: Path):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.novels_dir = novels_dir
+
+        self._lock = threading.Lock()
+        novels_dir.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(novels_dir / self.FILENAME, check_same_thread=False)
+        with self._db:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS novels (
+                    dir_name TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    chapter_count INTEGER NOT NULL,
+                    word_count INTEGER NOT NULL,
+                    last_chapter_scrape_ts REAL,
+                    mtime_ns INTEGER NOT NULL
+                )
+            """)
+
+    def _mtime_ns(self, novel_dir):
+        mtime_ns = 0
+        for fname in self.WATCHED_FILES:
+            try:
+                mtime_ns = max(mtime_ns, (novel_dir / fname).stat().st_mtime_ns)
+            except FileNotFoundError:
+                pass
+        return mtime_ns
+
+    def _summarise(self, novel_dir):
+        with open(novel_dir / 'metadata.json', 'r') as metadata_file:
+            metadata = json.load(metadata_file)
+
+        chapter_catalog = get_chapter_catalog(novel_dir)
+        return (metadata['title'], len(chapter_catalog), chapter_catalog.word_count(),
+                metadata.get('last_chapter_scrape_ts'))
+
+    def refresh(self):
+        with self._lock:
+            known = dict(self._db.execute("SELECT dir_name, mtime_ns FROM novels").fetchall())
+
+            updates = []
+            found = set()
+            with os.scandir(self.novels_dir) as entries:
+                for entry in entries:
+                    if not entry.is_dir() or entry.name.startswith('.'):
+                        continue
+                    novel_dir = Path(entry.path)
+                    if not (novel_dir / 'metadata.json').exists():
+                        continue
+
+                    found.add(entry.name)
+                    mtime_ns = self._mtime_ns(novel_dir)
+                    if known.get(entry.name) != mtime_ns:
+                        self.log.debug(f"Summarising '{entry.name}'")
+                        # Summarising may touch the chapter catalog, so take the time stamp afterwards
+                        summary = self._summarise(novel_dir)
+                        updates.append((entry.name, *summary, self._mtime_ns(novel_dir)))
+
+            with self._db:
+                self._db.executemany("INSERT OR REPLACE INTO novels VALUES (?, ?, ?, ?, ?, ?)", updates)
+                self._db.executemany("DELETE FROM novels WHERE dir_name = ?",
+                                     [(dir_name,) for dir_name in known.keys() - found])
+
+    def summaries(self) -> list[dict]:
+        with self._lock:
+            rows = self._db.execute(f"SELECT {', '.join(self.COLUMNS)} FROM novels ORDER BY title").fetchall()
+        return [dict(zip(self.COLUMNS, row)) for row in rows]
+
+
+_libraries: dict[Path, LibraryCatalog] = {}
+
+
+def get_library_catalog(novels_dir: Path) -> LibraryCatalog:
+    """ Get the shared catalog of a library, refreshed with any changes since it was last used """
+    with _catalogs_lock:
+        if novels_dir not in _libraries:
+            _libraries[novels_dir] = LibraryCatalog(novels_dir)
+        library = _libraries[novels_dir]
+    library.refresh()
+    return library
+
+
+if __name__ == '__main__':
+    from webnovels.utils import NOVELS_DIR
+
+    for summary in get_library_catalog(NOVELS_DIR).summaries():
+        print(f"{summary['title']}: {summary['chapter_count']} chapters, {summary['word_count']} words")
@@ -1,88 +1,299 @@
+import bisect
+import functools
 import gzip
+import hashlib
 import json
 import logging
+import os
+import pickle
 import pkgutil
 import re
+import tempfile
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from operator import itemgetter
 from pathlib import Path
+from typing import Any, Callable
 
+import spellchecker
 from spellchecker import SpellChecker
 from spellchecker.utils import ensure_unicode
 
-from webnovels.utils import WHITESPACE, NOVELS_DIR, get_chapter_index, get_file_safe, get_novel_dir
+from webnovels.storage import ChapterStore, get_chapter_store
+from webnovels.suggestions import (INDEX_VERSION, MAX_DISTANCE, PREFIX_LENGTH, CompiledDeletionIndex, DeletionIndex,
+                                   edit_distance)
+from webnovels.text_buffer import PieceTable
+from webnovels.utils import CACHE_DIR, WHITESPACE, NOVELS_DIR, get_chapter_index, get_file_safe, get_novel_dir
 
 ChangeRecord = dict[str, int | str]
 
 
-class NovelSpellChecker:
+SPELLING_CACHE_DIR = CACHE_DIR / 'spelling'
+GLOBAL_DICT_EXT = Path(__file__).parent / '.resources' / 'dictionary_ext.txt'
+
+_dictionary_loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='dictionary')
+_base_dictionary: Future | None = None
+_base_suggestions: Future | None = None
+_base_dictionary_lock = threading.Lock()
+_global_words: set[str] = set()
+
+
+def _read_word_list(fp: Path) -> set[str]:
+    try:
+        with open(fp, 'r') as dict_ext:
+            return set(dict_ext.read().split())
+    except FileNotFoundError:
+        return set()
+
+
+def _load_compiled(cache_fp: Path, build: Callable[[], Any]):
+    """ Unpickle something built before, or build it and pickle it for next time """
+    log = logging.getLogger('_load_compiled')
+    try:
+        with open(cache_fp, 'rb') as cache_file:
+            compiled = pickle.load(cache_file)
+        log.debug(f"Loaded {cache_fp}")
+        return compiled
+    except FileNotFoundError:
+        pass
+    except (pickle.UnpicklingError, EOFError, AttributeError) as exc:
+        log.warning(f"Rebuilding unreadable {cache_fp}: {exc}")
+
+    compiled = build()
+    cache_fp.parent.mkdir(parents=True, exist_ok=True)
+    # Processes starting together may all build it, so each writes its own file and the last to finish wins
+    with tempfile.NamedTemporaryFile('wb', dir=cache_fp.parent, prefix=cache_fp.name, suffix='.tmp',
+                                     delete=False) as cache_file:
+        try:
+            pickle.dump(compiled, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        except BaseException:
+            cache_file.close()
+            os.unlink(cache_file.name)
+            raise
+    os.replace(cache_file.name, cache_fp)
+    log.info(f"Compiled {cache_fp}")
+    return compiled
+
+
+def _build_base_dictionary() -> SpellChecker:
+    # Manually load the language file or else we can't do case-sensitive. This will lead to some side effects
+    # with proper nouns since the words in the corpus are all lowered.
+    # TODO: Fix this?
+    spell = SpellChecker(case_sensitive=True, language=None)
+    filename = f"resources/en.json.gz"
+    try:
+        json_open = pkgutil.get_data("spellchecker", filename)
+    except FileNotFoundError as exc:
+        msg = f"The provided dictionary language (en) does not exist!"
+        raise ValueError(msg) from exc
+    lang_dict = json.loads(gzip.decompress(json_open).decode("utf-8"))
+    spell.word_frequency.load_json(lang_dict)
+    return spell
+
+
+def _compile_base_dictionary() -> SpellChecker:
+    """ Build the case-sensitive English SpellChecker, or unpickle it if it has been built before
+
+    Parsing en.json.gz and building the word frequency table takes several times longer than unpickling the
+    finished SpellChecker, so the result is cached per pyspellchecker version.
     """
+    spell = _load_compiled(SPELLING_CACHE_DIR / f'en-{spellchecker.__version__}.pickle', _build_base_dictionary)
+    _global_words.update(_read_word_list(GLOBAL_DICT_EXT))
+    return spell
+
+
+def _compile_base_suggestions() -> CompiledDeletionIndex:
+    """ Build the deletion index of the base dictionary, which takes seconds, or unpickle it """
+    spell = _base_dictionary.result()
+    cache_fp = (SPELLING_CACHE_DIR
+                / f'en-{spellchecker.__version__}-deletes-v{INDEX_VERSION}-{MAX_DISTANCE}-{PREFIX_LENGTH}.pickle')
+    return _load_compiled(cache_fp, lambda: CompiledDeletionIndex.build(spell.word_frequency.dictionary))
 
+
+def load_base_dictionary(suggestions: bool = True) -> Future:
+    """ Start loading the base dictionary shared by every novel on a background thread, if not already started
+
+    Args:
+        suggestions: also load the deletion index used for suggestions after it, see load_base_suggestions()
     """
-    GLOBAL_DICT_EXT = Path(__file__).parent / '.resources' / 'dictionary_ext.txt'
+    global _base_dictionary, _base_suggestions
+    with _base_dictionary_lock:
+        if _base_dictionary is None:
+            _base_dictionary = _dictionary_loader.submit(_compile_base_dictionary)
+        if suggestions and _base_suggestions is None:
+            _base_suggestions = _dictionary_loader.submit(_compile_base_suggestions)
+        return _base_dictionary
+
+
+def load_base_suggestions() -> Future:
+    load_base_dictionary()
+    return _base_suggestions
+
+
+class NovelSpellChecker:
+    """ Spell checking against the shared base dictionary plus the words added for one novel
+
+    The base dictionary and global word list are loaded once per process in the background, see
+    load_base_dictionary(). Loading a novel only reads its own small word list, and methods that need the base
+    dictionary wait for it to finish loading.
+    """
+    GLOBAL_DICT_EXT = GLOBAL_DICT_EXT
     LOCAL_DICT_EXT = None
 
-    def __init__(self):
+    # Either a run of repeated spaces, or a whole token with the word separated from the brackets, quotes and
+    # punctuation around it
+    TOKEN_PATTERN = re.compile(r"""
+        (?P<spaces>[ \t]{2,})
+        | (?<![^ \n\t]) [(\[{‘“]* (?P<word>[^ \n\t]*?) [.,!?;:")\]}…’”]* (?![^ \n\t])
+    """, re.VERBOSE)
+    HTML_TAG_PATTERN = re.compile(r'<[\/a-z]{,5}>')
+    VERDICT_CACHE_SIZE = 2 ** 16
+    VERSION = 1  # Part of the dictionary version, bump it when the way errors are found changes
+
+    def __init__(self, suggestions: bool = True):
+        """
+        Args:
+            suggestions: start loading the suggestion index straight away, checkers which only find errors can
+                leave it until suggestions() is first called
+        """
         self.log = logging.getLogger(self.__class__.__name__)
 
-        self._spell = None
+        self._base = load_base_dictionary(suggestions)
+        self._base_suggestions = load_base_suggestions() if suggestions else None
+        self._local_words: set[str] = set()
+        self._added_index: DeletionIndex | None = None
+        self._dictionary_version = None
 
-    def load_novel(self, novel_title: str):
-        novel_dir = NOVELS_DIR / get_file_safe(novel_title)
+        # Whether each word is an error, cleared whenever the dictionary changes
+        self._is_error = functools.lru_cache(maxsize=self.VERDICT_CACHE_SIZE)(self._check_word)
 
-        self.LOCAL_DICT_EXT = novel_dir / '.resources' / 'dictionary_ext.txt'
+    @property
+    def _spell(self) -> SpellChecker:
+        return self._base.result()
 
-        self._spell = SpellChecker(case_sensitive=True, language=None)
+    @property
+    def ready(self) -> bool:
+        """ Whether the base dictionary has loaded, so checking won't block """
+        return self._base.done()
 
-        # Manually load the language file or else we can't do case-sensitive. This will lead to some side effects
-        # with proper nouns since the words in the corpus are all lowered.
-        # TODO: Fix this?
-        filename = f"resources/en.json.gz"
-        try:
-            json_open = pkgutil.get_data("spellchecker", filename)
-        except FileNotFoundError as exc:
-            msg = f"The provided dictionary language (en) does not exist!"
-            raise ValueError(msg) from exc
-        lang_dict = json.loads(gzip.decompress(json_open).decode("utf-8"))
-        self._spell.word_frequency.load_json(lang_dict)
+    @staticmethod
+    def read_local_words(novel_title: str) -> set[str]:
+        """ Read the words added for a novel, ready to pass to load_novel() """
+        return _read_word_list(NOVELS_DIR / get_file_safe(novel_title) / '.resources' / 'dictionary_ext.txt')
 
-        self._spell.word_frequency.load_text_file(self.GLOBAL_DICT_EXT)
-        self._spell.word_frequency.load_text_file(self.LOCAL_DICT_EXT)
+    def load_novel(self, novel_title: str, local_words: set[str] = None):
+        """ Check against a novel's words, read from its dictionary unless they've already been read """
+        novel_dir = NOVELS_DIR / get_file_safe(novel_title)
 
-    def get_potential_errors(self, text):
-        whitespace_indices = [i for i, c in enumerate(text) if c in WHITESPACE] + [len(text)]
+        self.LOCAL_DICT_EXT = novel_dir / '.resources' / 'dictionary_ext.txt'
+        self._local_words = _read_word_list(self.LOCAL_DICT_EXT) if local_words is None else local_words
+        self._is_error.cache_clear()
+        self._added_index = None
+        self._dictionary_version = None
 
-        potential_errors = []
+    @property
+    def dictionary_version(self) -> str:
+        """ A hash of every word list this checker uses, which changes whenever a word is added """
+        if self._dictionary_version is None:
+            self._base.result()  # The global words are loaded along with the base dictionary
+            words = [str(self.VERSION), spellchecker.__version__,
+                     *sorted(_global_words), '', *sorted(self._local_words)]
+            self._dictionary_version = hashlib.sha256('\n'.join(words).encode('utf-8')).hexdigest()
+        return self._dictionary_version
+
+    def is_known(self, word) -> bool:
+        return word in self._spell.word_frequency.dictionary or word in _global_words or word in self._local_words
+
+    def get_potential_errors(self, text, start=0, end=None):
+        """ Find the ranges of text which may be spelling errors, or are repeated spaces
+
+        Args:
+            text: the text to check
+            start: where to start checking, which must be the start of a word or run of whitespace
+            end: where to stop checking, which must be the end of a word or run of whitespace, defaults to the
+                end of the text
+        """
+        if end is None:
+            end = len(text)
 
-        start_index = 0
-        for end_index in whitespace_indices:
-            if start_index == end_index:
-                self.log.warning(f"Equal space indices found ({start_index}), continuing")
+        potential_errors = []
+        for match in self.TOKEN_PATTERN.finditer(text, start, end):
+            if match['spaces']:
+                potential_errors.append(match.span('spaces'))
                 continue
 
-            if start_index + 1 == end_index:
-                self.log.warning(f"Consecutive spaces found {start_index, end_index}, continuing")
-                potential_errors.append((start_index, end_index))
-            else:
-                cleaned_token = self.clean_token(text[start_index:end_index])
-                if self._spell._check_if_should_check(cleaned_token):
-                    if cleaned_token not in self._spell.word_frequency.dictionary:
-                        try:
-                            cleaned_start_index = text.index(cleaned_token, start_index, end_index)
-                        except ValueError:
-                            self.log.warning(f"Could not find word '{cleaned_token}' in '{text[start_index:end_index]}' {start_index, end_index}")
-                        else:
-                            potential_errors.append((cleaned_start_index, cleaned_start_index + len(cleaned_token)))
-
-            start_index = end_index + 1
-
-        # TODO: find consecutive space errors
+            word = match['word']
+            if not word:
+                continue
+            if '<' in word and '>' in word:
+                # The tags split the word up, so check the word without them but mark the whole thing
+                if self._is_error(self.clean_token(word)):
+                    potential_errors.append(match.span('word'))
+            elif self._is_error(word):
+                potential_errors.append(match.span('word'))
 
         return potential_errors
 
+    def _check_word(self, word) -> bool:
+        return self._spell._check_if_should_check(word) and not self.is_known(word)
+
+    @staticmethod
+    def _word_span(text, start, end):
+        """ Widen a range of text to whole words and the whitespace around them """
+        while start > 0 and text[start - 1] not in WHITESPACE:
+            start -= 1
+        while start > 0 and text[start - 1] in WHITESPACE:
+            start -= 1
+        while end < len(text) and text[end] not in WHITESPACE:
+            end += 1
+        while end < len(text) and text[end] in WHITESPACE:
+            end += 1
+        return start, end
+
+    def recheck_edit(self, potential_errors, text, start_idx: int, old_end_idx: int, new_end_idx: int):
+        """ Update the potential errors of a text after one edit by checking only the words it touched
+
+        Args:
+            potential_errors: the sorted potential errors from before the edit
+            text: the text after the edit
+            start_idx: the start of the edit
+            old_end_idx: the end of the replaced text, before the edit
+            new_end_idx: the end of the inserted text, after the edit
+
+        Returns:
+            The potential errors after the edit, then the ranges added and removed by it. Removed ranges are
+            given where their text now is, so both can be applied to the edited text.
+        """
+        delta = new_end_idx - old_end_idx
+        span_start, span_end = self._word_span(text, start_idx, new_end_idx)
+
+        # Errors are sorted and don't overlap, so the ones inside the rechecked span are a contiguous slice
+        first = bisect.bisect_right(potential_errors, span_start, key=itemgetter(1))
+        last = bisect.bisect_left(potential_errors, span_end - delta, key=itemgetter(0))
+
+        def moved(idx, inside):
+            if idx <= start_idx:
+                return idx
+            if idx >= old_end_idx:
+                return idx + delta
+            return inside
+
+        old_errors = [(moved(s, start_idx), moved(e, new_end_idx)) for s, e in potential_errors[first:last]]
+        # Only the span is read, so text can be anything that slices like a str, e.g. EditTracker.text
+        new_errors = [(s + span_start, e + span_start)
+                      for s, e in self.get_potential_errors(text[span_start:span_end])]
+
+        updated_errors = (potential_errors[:first] + new_errors +
+                          [(s + delta, e + delta) for s, e in potential_errors[last:]])
+        added = [error for error in new_errors if error not in old_errors]
+        removed = [error for error in old_errors if error not in new_errors]
+        return updated_errors, added, removed
+
     def clean_token(self, token):
         # Special case: HTML tags
         if '<' in token and '>' in token:
-            token = ''.join(re.split(r'<[\/a-z]{,5}>', token))
+            token = ''.join(self.HTML_TAG_PATTERN.split(token))
 
         # punctuation = '.,!?;:"\'()[]{} -–—…\n‘’“”'
         # strip_chars = '.,!?;:"\'()[]{}…‘’“”'
@@ -92,17 +303,66 @@ class NovelSpellChecker:
 
         return ensure_unicode(token.lstrip(allowed_before).rstrip(allowed_after))
 
+    @property
+    def added_words_index(self) -> DeletionIndex:
+        if self._added_index is None:
+            self._base.result()  # The global words are loaded along with the base dictionary
+            self._added_index = DeletionIndex(_global_words | self._local_words)
+        return self._added_index
+
+    def suggestions(self, word, limit: int | None = 10) -> list[str]:
+        """ Known words within two edits of word, closest first, then words added to the dictionaries, then the
+        most common
+
+        Like SpellChecker.candidates, words two edits away are only looked for if there are none one edit away.
+        """
+        # The base dictionary is all lower case, so match capitalised words in lower case and capitalise the results
+        capitalised = word[:1].isupper()
+        query = word[:1].lower() + word[1:] if capitalised else word
+        frequencies = self._spell.word_frequency.dictionary
+        if self._base_suggestions is None:
+            self._base_suggestions = load_base_suggestions()
+
+        ranked = {}
+        for max_distance in range(1, MAX_DISTANCE + 1):
+            for candidate in self.added_words_index.lookup(word, max_distance):
+                distance = edit_distance(word, candidate, max_distance)
+                if distance <= max_distance:
+                    ranked[candidate] = distance, 0, 0
+
+            for candidate in self._base_suggestions.result().lookup(query, max_distance):
+                distance = edit_distance(query, candidate, max_distance)
+                if distance <= max_distance:
+                    frequency = frequencies[candidate]
+                    if capitalised:
+                        candidate = candidate[:1].upper() + candidate[1:]
+                    ranked.setdefault(candidate, (distance, 1, -frequency))
+
+            if ranked:
+                break
+
+        return sorted(ranked, key=ranked.get)[:limit]
+
     def candidates(self, word):
-        return self._spell.candidates(word)
+        if self.is_known(word):
+            return {word}
+        return set(self.suggestions(word, limit=None)) or None
 
     def add_word(self, word, local=True):
-        self._spell.word_frequency.add(word)
         if local:
-            with open(self.LOCAL_DICT_EXT, 'a') as dict_ext:
-                dict_ext.write(word)
+            self._local_words.add(word)
+            dict_ext_fp = self.LOCAL_DICT_EXT
         else:
-            with open(self.GLOBAL_DICT_EXT, 'a') as dict_ext:
-                dict_ext.write(word)
+            _global_words.add(word)
+            dict_ext_fp = self.GLOBAL_DICT_EXT
+        self._is_error.cache_clear()
+        if self._added_index is not None:
+            self._added_index.add(word)
+        self._dictionary_version = None
+
+        dict_ext_fp.parent.mkdir(parents=True, exist_ok=True)
+        with open(dict_ext_fp, 'a') as dict_ext:
+            dict_ext.write(f'{word}\n')
 
 
 class EditTracker:
@@ -115,8 +375,17 @@ class EditTracker:
         "edit_ts": 1234567890     # Time of edit
     }
 
+    Saved changes are appended to the chapter's change journal, a JSON lines document of these records
+    {"op": "push", "change": {...}}                     # A change added to the history
+    {"op": "pop", "count": 2}                           # Changes undone and removed from the history
+    {"op": "snapshot", "text": "...", "history": [...]} # The processed text, and the history if compacted
+
+    Loading starts from the last snapshot's text and only replays the records after it. The history is rebuilt
+    from every record, so changes from before a snapshot or compaction can still be undone.
     """
     MERGE_TIME_LIMIT = 60
+    SNAPSHOT_INTERVAL = 50  # Journal records between snapshots
+    COMPACT_INTERVAL = 4    # Snapshots between compactions
 
     def __init__(self):
         self.log = logging.getLogger(self.__class__.__name__)
@@ -125,37 +394,56 @@ class EditTracker:
         self.redo_stack: list[ChangeRecord] = []
         self.mergeable: bool = False  # Flag which indicates the next change may be merged into the previous
 
-        self.change_json_fp: Path = None
+        self._store: ChapterStore = None
+        self._chapter_idx: int = None
         self._raw_text: str = None
-        self._processed_text: str = None
+        self._buffer: PieceTable = None  # The processed text
+
+        # The history as of the last save is history[:_saved_length], of which the first _unchanged_length
+        # changes haven't been undone since
+        self._saved_length = 0
+        self._unchanged_length = 0
+        self._records_since_snapshot = 0
+        self._snapshots_since_compaction = 0
+        self._needs_compaction = False
 
         self.last_save = time.time()
 
+    @property
+    def chapter_idx(self) -> int:
+        return self._chapter_idx
+
     @property
     def raw_text(self) -> str:
         return self._raw_text
 
+    @property
+    def text(self) -> PieceTable:
+        """ The processed text, for reading parts of it without building the whole string """
+        return self._buffer
+
     @property
     def processed_text(self) -> str:
-        # return self.apply_changelist(self.raw_text, self.history)
-        return self._processed_text
+        # Only built after an edit when first needed, then kept until the next one
+        return str(self._buffer) if self._buffer is not None else None
 
     def record_change(self, start_idx: int, end_idx: int, new_text: str):
         """
         Record a new text change and optionally merge with the previous one
         if it's a consecutive edit (e.g., typing characters sequentially).
         """
-        if self.processed_text[start_idx:end_idx] == new_text:
+        old_text = self._buffer[start_idx:end_idx]
+        if old_text == new_text:
             self.log.warning("Skipping identical change")
             return
 
         change = {
             "start_idx": start_idx,
-            "old_text": self._processed_text[start_idx:end_idx],
+            "old_text": old_text,
             "new_text": new_text,
             "edit_ts": time.time(),
         }
-        self._processed_text = self._apply_change(self._processed_text, change)
+        self._apply_change(self._buffer, change)
 
         # Try to merge with the previous change if applicable
         if self.history:
@@ -177,6 +465,7 @@ class EditTracker:
                     "edit_ts": time.time(),
                 }
                 self.history.pop()
+                self._unchanged_length = min(self._unchanged_length, len(self.history))
 
         self.log.debug(f"Adding change to stack: {change}")
         self.history.append(change)
@@ -184,77 +473,177 @@ class EditTracker:
 
         self.mergeable = True
 
-    def _apply_change(self, text: str, change: ChangeRecord) -> str:
+    def _apply_change(self, buffer: PieceTable, change: ChangeRecord):
         # Calculate the end index from the text string to skip the calculation in _apply_inverse
         start_idx, end_idx = change["start_idx"], change["start_idx"] + len(change["old_text"])
-        return text[:start_idx] + change["new_text"] + text[end_idx:]
+        buffer.replace(start_idx, end_idx, change["new_text"])
 
-    def _apply_changelist(self, text: str, changelist: list[ChangeRecord]):
-        processed_text = text[:]
+    def _apply_changelist(self, text: str, changelist: list[ChangeRecord]) -> PieceTable:
+        buffer = PieceTable(text)
         for change in changelist:
-            processed_text = self._apply_change(processed_text, change)
-        return processed_text
+            self._apply_change(buffer, change)
+        return buffer
 
-    def _apply_inverse(self, text: str, change: ChangeRecord):
+    def _apply_inverse(self, buffer: PieceTable, change: ChangeRecord) -> ChangeRecord:
         inverse_change = {
             "start_idx": change["start_idx"],
             "old_text": change["new_text"],
             "new_text": change["old_text"],
         }
-        return self._apply_change(text, inverse_change)
+        self._apply_change(buffer, inverse_change)
+        return inverse_change
+
+    def undo(self) -> ChangeRecord | None:
+        """ Undo the last change
 
-    def undo(self):
+        Returns:
+            The change made to the text to undo it, or None if there was nothing to undo
+        """
         if not self.history:
-            return
+            return None
 
         self.mergeable = False
 
         change = self.history.pop()
-        self._processed_text = self._apply_inverse(self._processed_text, change)
+        self._unchanged_length = min(self._unchanged_length, len(self.history))
+        inverse_change = self._apply_inverse(self._buffer, change)
         self.redo_stack.append(change)
+        return inverse_change
+
+    def redo(self) -> ChangeRecord | None:
+        """ Redo the last undone change
 
-    def redo(self):
+        Returns:
+            The change made to the text, or None if there was nothing to redo
+        """
         if not self.redo_stack:
-            return
+            return None
 
         self.mergeable = False
 
         change = self.redo_stack.pop()
-        self._processed_text = self._apply_change(self._processed_text, change)
+        self._apply_change(self._buffer, change)
         self.history.append(change)
+        return change
 
     def save(self):
-        if not self.change_json_fp:
+        """ Append the changes made since the last save to the change journal """
+        if not self._store:
             return
 
         self.mergeable = False
 
-        self.log.debug(f"Saving edits to {self.change_json_fp}")
-        with open(self.change_json_fp, "w") as change_json:
-            json.dump(self.history, change_json, indent=2)
+        if self._needs_compaction:
+            self.compact()
+            return
+
+        records = []
+        popped = self._saved_length - self._unchanged_length
+        if popped:
+            records.append({"op": "pop", "count": popped})
+        records.extend({"op": "push", "change": change} for change in self.history[self._unchanged_length:])
+        if not records:
+            return
+
+        self._records_since_snapshot += len(records)
+        if self._records_since_snapshot >= self.SNAPSHOT_INTERVAL:
+            records.append({"op": "snapshot", "text": self.processed_text})
+            self._records_since_snapshot = 0
+            self._snapshots_since_compaction += 1
+
+        self.log.debug(f"Saving {len(records)} records to change journal {self._chapter_idx}")
+        self._store.append("change_journals", self._chapter_idx, ''.join(json.dumps(r) + '\n' for r in records))
+        self._saved_length = self._unchanged_length = len(self.history)
+        self.last_save = time.time()
+
+        if self._snapshots_since_compaction >= self.COMPACT_INTERVAL:
+            self.compact()
+
+    def compact(self):
+        """ Replace the change journal with one snapshot of the processed text and the whole history """
+        if not self._store:
+            return
+
+        self.log.debug(f"Compacting change journal {self._chapter_idx}")
+        snapshot = {"op": "snapshot", "text": self.processed_text, "history": self.history}
+        self._store.write("change_journals", self._chapter_idx, json.dumps(snapshot) + '\n')
+
+        self._saved_length = self._unchanged_length = len(self.history)
+        self._records_since_snapshot = 0
+        self._snapshots_since_compaction = 0
+        self._needs_compaction = False
         self.last_save = time.time()
 
+    def _load_journal(self, journal: str):
+        self.history = []
+        base_text = self.raw_text
+        replay = []  # (change, inverse) to apply to base_text
+        self._records_since_snapshot = 0
+        self._snapshots_since_compaction = 0
+
+        for line in journal.splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Most likely a line cut short by a crash
+                self.log.warning(f"Skipping unreadable journal line: {line!r}")
+                continue
+
+            if record["op"] == "snapshot":
+                if "history" in record:
+                    self.history = record["history"]
+                    self._snapshots_since_compaction = 0
+                else:
+                    self._snapshots_since_compaction += 1
+                base_text = record["text"]
+                replay = []
+                self._records_since_snapshot = 0
+            elif record["op"] == "push":
+                self.history.append(record["change"])
+                replay.append((record["change"], False))
+                self._records_since_snapshot += 1
+            elif record["op"] == "pop":
+                popped = self.history[len(self.history) - record["count"]:]
+                del self.history[len(self.history) - record["count"]:]
+                replay.extend((change, True) for change in reversed(popped))
+                self._records_since_snapshot += 1
+            else:
+                self.log.warning(f"Skipping unknown journal record: {record['op']}")
+
+        self._buffer = PieceTable(base_text)
+        for change, inverse in replay:
+            if inverse:
+                self._apply_inverse(self._buffer, change)
+            else:
+                self._apply_change(self._buffer, change)
+
     def load_chapter(self, novel_title, chapter_title):
         self.log.debug(f"Loading chapter '{chapter_title}' from novel '{novel_title}'")
+        self.load_chapter_index(novel_title, get_chapter_index(novel_title, chapter_title))
+
+    def load_chapter_index(self, novel_title, chapter_idx: int):
         self.mergeable = False
 
-        novel_dir = get_novel_dir(novel_title)
-        chapter_idx = get_chapter_index(novel_title, chapter_title)
+        self._store = get_chapter_store(get_novel_dir(novel_title))
+        self._chapter_idx = chapter_idx
 
-        with open(novel_dir / "raw_chapters" / f"{chapter_idx}.txt", "r") as txt_file:
-            self._raw_text = txt_file.read()
+        self._raw_text = self._store.read("raw_chapters", chapter_idx)
 
-        self.change_json_fp = novel_dir / "change_lists" / f"{chapter_idx}.json"
-        if self.change_json_fp.exists():
-            with open(self.change_json_fp, "r") as change_json:
-                self.history = json.load(change_json)
+        self._needs_compaction = False
+        if self._store.exists("change_journals", chapter_idx):
+            self._load_journal(self._store.read("change_journals", chapter_idx))
+        elif self._store.exists("change_lists", chapter_idx):
+            # A change list from before journals, which the first save turns into one
+            self.history = json.loads(self._store.read("change_lists", chapter_idx))
+            self._buffer = self._apply_changelist(self.raw_text, self.history)
+            self._needs_compaction = True
         else:
-            self.log.debug(f"Initialising change list at {self.change_json_fp}")
+            # The change journal is created by the first save
+            self.log.debug(f"No change journal for chapter {chapter_idx}")
             self.history = []
-            with open(self.change_json_fp, "x") as change_json:
-                json.dump(self.history, change_json)
+            self._buffer = PieceTable(self.raw_text)
 
-        self._processed_text = self._apply_changelist(self.raw_text, self.history)
+        self._saved_length = self._unchanged_length = len(self.history)
         self.redo_stack = []
 
 
@@ -347,7 +736,8 @@ if __name__ == '__main__':
     editor = EditTracker()
     editor.load_chapter(novel_title, 'Chapter 1: Quicksave')
 
-    speller = NovelSpellChecker(novel_title)
+    speller = NovelSpellChecker()
+    speller.load_novel(novel_title)
     speller.get_potential_errors(editor.processed_text)
     print(1)
     # novel_spellchecker = get_novel_spellchecker(novel_title)
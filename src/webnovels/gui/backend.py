@@ -1,7 +1,14 @@
-from webnovels.editing import EditTracker, NovelSpellChecker
+from collections import OrderedDict
+from typing import Callable
+
+from webnovels.catalog import get_chapter_catalog
+from webnovels.editing import ChangeRecord, EditTracker, NovelSpellChecker
+from webnovels.spelling import error_index_key
+from webnovels.utils import get_novel_dir
 
 
 class Backend:
+    CHAPTER_CACHE_SIZE = 8  # Loaded chapters kept to be shown again without reading and checking them
     _instance = None
 
     def __new__(cls, *args, **kwargs):
@@ -16,8 +23,13 @@ class Backend:
 
         self.novel_title = None
         self.chapter_title = None
-        self.potential_errors = []
+        self.chapter_novel_title = None  # The novel the chapter being edited is from, which may no longer be open
+        self.potential_errors = []  # None while the chapter is being checked
         self.selected_error = None
+        self.text_version = 0  # Counts changes to the chapter text, so out of date checks can be spotted
+
+        # (novel_title, chapter_idx) -> (edit_tracker, potential_errors), least recently shown first
+        self._chapters: OrderedDict[tuple[str, int], tuple[EditTracker, list[tuple[int, int]] | None]] = OrderedDict()
 
     @property
     def chapter_text(self):
@@ -27,27 +39,177 @@ class Backend:
         self.edit_tracker.save()
 
     def undo(self):
-        self.edit_tracker.undo()
+        """ Undo the last edit and recheck the words around it
 
-    def redo(self):
-        self.edit_tracker.undo()
+        Returns:
+            The change made to the text and the potential error ranges it added and removed, or None if there
+            was nothing to undo
+        """
+        return self._recheck_change(self.edit_tracker.undo())
 
-    def load_novel(self, novel_title):
+    def redo(self):
+        """ Redo the last undone edit, returning the same as undo() """
+        return self._recheck_change(self.edit_tracker.redo())
+
+    def _recheck_change(self, change: ChangeRecord | None):
+        if change is None:
+            return None
+
+        self.text_version += 1
+        if self.potential_errors is None:
+            return change, [], []
+
+        start_idx = change["start_idx"]
+        self.potential_errors, added, removed = self.spell_checker.recheck_edit(
+            self.potential_errors, self.edit_tracker.text,
+            start_idx, start_idx + len(change["old_text"]), start_idx + len(change["new_text"]))
+        return change, added, removed
+
+    @staticmethod
+    def read_novel(novel_title):
+        """ Read what's needed to open a novel, which is safe to do on any thread
+
+        Returns:
+            The local words to pass to load_novel()
+        """
+        return NovelSpellChecker.read_local_words(novel_title)
+
+    def load_novel(self, novel_title, local_words: set[str] = None):
+        """ Open a novel, using the result of read_novel() if it's been read already """
         self.novel_title = novel_title
 
-        self.spell_checker.load_novel(novel_title)
-
-    def load_chapter(self, chapter_title):
-        self.chapter_title = chapter_title
+        self.spell_checker.load_novel(novel_title, local_words)
 
-        self.edit_tracker.load_chapter(self.novel_title, self.chapter_title)
-        self.potential_errors = self.spell_checker.get_potential_errors(self.edit_tracker.processed_text)
+    def load_chapter(self, chapter_title, chapter_idx=None):
+        """ Load a chapter by name_index, or by title if no index is given """
+        self.show_chapter(chapter_title, self.read_chapter(self.novel_title, chapter_title, chapter_idx))
+        self.set_potential_errors(*self.prepare_check()())
 
         return self.chapter_text
 
+    @staticmethod
+    def read_chapter(novel_title, chapter_title, chapter_idx=None) -> EditTracker:
+        """ Load a chapter into a new EditTracker, which is safe to do on any thread """
+        edit_tracker = EditTracker()
+        if chapter_idx is None:
+            edit_tracker.load_chapter(novel_title, chapter_title)
+        else:
+            edit_tracker.load_chapter_index(novel_title, chapter_idx)
+        return edit_tracker
+
+    def prefetch_chapter(self, novel_title, chapter_title, chapter_idx):
+        """ Read a chapter and find its potential errors ahead of it being shown, which is safe to do on any thread
+
+        Returns:
+            The arguments for remember_chapter()
+        """
+        edit_tracker = self.read_chapter(novel_title, chapter_title, chapter_idx)
+        _, potential_errors = self.prepare_check(novel_title, edit_tracker)()
+        return novel_title, edit_tracker, potential_errors
+
+    def show_chapter(self, chapter_title, edit_tracker: EditTracker, potential_errors=None):
+        """ Make a chapter from read_chapter() or recall_chapter() the one being edited
+
+        If its potential errors aren't given they must be found separately, see prepare_check().
+        """
+        self._remember_current()
+
+        self.chapter_novel_title = self.novel_title
+        self.chapter_title = chapter_title
+        self.edit_tracker = edit_tracker
+        self.potential_errors = potential_errors
+        self.text_version += 1
+        self._remember_current()
+
+    def _remember_current(self):
+        if self.edit_tracker.text is not None:
+            self.remember_chapter(self.chapter_novel_title, self.edit_tracker, self.potential_errors, replace=True)
+
+    def remember_chapter(self, novel_title, edit_tracker: EditTracker, potential_errors, replace=False):
+        """ Keep a loaded chapter to be shown again, dropping the least recently shown if there are too many
+
+        Args:
+            replace: whether to replace a chapter already kept, which may have been edited since
+        """
+        key = novel_title, edit_tracker.chapter_idx
+        if key in self._chapters and not replace:
+            return
+        self._chapters[key] = edit_tracker, potential_errors
+        self._chapters.move_to_end(key)
+        while len(self._chapters) > self.CHAPTER_CACHE_SIZE:
+            self._chapters.popitem(last=False)
+
+    def recall_chapter(self, novel_title, chapter_idx) -> tuple[EditTracker, list[tuple[int, int]] | None] | None:
+        """ Get a kept chapter and its potential errors, if the errors are still being found they're None """
+        self._remember_current()
+        return self._chapters.get((novel_title, chapter_idx))
+
+    def is_remembered(self, novel_title, chapter_idx) -> bool:
+        return (novel_title, chapter_idx) in self._chapters
+
+    def prepare_check(self, novel_title=None, edit_tracker: EditTracker = None
+                      ) -> Callable[[], tuple[int, list[tuple[int, int]]]]:
+        """ Capture what's needed to find the potential errors of a chapter as it is now, by default the one being
+        edited
+
+        Returns:
+            A function which can be run on any thread, returning the text version it checked and the potential
+            errors found, to pass on to set_potential_errors(). It uses the errors stored by the last check of
+            the chapter if its content hasn't changed since.
+        """
+        novel_title = novel_title or self.novel_title
+        edit_tracker = edit_tracker or self.edit_tracker
+
+        catalog = get_chapter_catalog(get_novel_dir(novel_title))
+        chapter_idx = edit_tracker.chapter_idx
+        raw_text = edit_tracker.raw_text
+        history = list(edit_tracker.history)  # Changes aren't modified once recorded, only the list
+        text = edit_tracker.processed_text
+        text_version = self.text_version
+
+        def check():
+            # The dictionary version waits for the dictionary to load, so it's left to the background too
+            content_key = error_index_key(raw_text, history, self.spell_checker.dictionary_version)
+            potential_errors = catalog.errors(chapter_idx, content_key)
+            if potential_errors is None:
+                potential_errors = self.spell_checker.get_potential_errors(text)
+                catalog.set_errors({chapter_idx: (content_key, potential_errors)})
+            return text_version, potential_errors
+
+        return check
+
+    def set_potential_errors(self, text_version: int, potential_errors: list[tuple[int, int]]) -> bool:
+        """ Use the result of a check, unless the text has changed since it was prepared
+
+        Returns:
+            Whether the errors were used
+        """
+        if text_version != self.text_version:
+            return False
+        self.potential_errors = potential_errors
+        return True
+
     def make_edit(self, start_idx: int, end_idx: int, new_text: str):
+        """ Record an edit and recheck the words around it
+
+        Returns:
+            The potential error ranges added and removed by the edit, as indices into the edited text
+        """
+        if self.edit_tracker.text[start_idx:end_idx] == new_text:
+            return [], []
+
         self.edit_tracker.record_change(start_idx, end_idx, new_text)
-        # FIXME: updated potential errors (when necessary?)
+        self.text_version += 1
+        if self.potential_errors is None:
+            return [], []  # The chapter is still being checked
+
+        self.potential_errors, added, removed = self.spell_checker.recheck_edit(
+            self.potential_errors, self.edit_tracker.text, start_idx, end_idx, start_idx + len(new_text))
+        return added, removed
 
     def add_word(self, word, local=True):
         self.spell_checker.add_word(word, local)
+
+        # Kept chapters may have been checked with the word treated as an error
+        for key, (edit_tracker, _) in self._chapters.items():
+            self._chapters[key] = edit_tracker, None
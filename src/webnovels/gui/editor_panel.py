@@ -1,11 +1,12 @@
-import difflib
+import functools
 import logging
 import tkinter as tk
 from tkinter import ttk
 
 from gui_components import ScrollableListBox, ScrollableTextBox
 from webnovels.gui.backend import Backend
-from webnovels.utils import get_novel_chapter_titles, get_novel_titles, to_tk_index
+from webnovels.gui.jobs import JobRunner
+from webnovels.utils import get_chapter_info, get_novel_titles
 
 
 class EditorPanel(ttk.Frame):
@@ -14,9 +15,12 @@ class EditorPanel(ttk.Frame):
         self.log = logging.getLogger(self.__class__.__name__)
 
         self.backend = Backend()
+        self.jobs = JobRunner(self)
+        self.prefetch_jobs = JobRunner(self)  # Separate so chapters being shown never wait behind a prefetch
 
         self.novel_selector = None
         self.chapter_selector = None
+        self.chapter_info = []  # In the same order as the chapter selector options
 
         self.chapter_text: ScrollableTextBox = None
 
@@ -38,27 +42,94 @@ class EditorPanel(ttk.Frame):
     def on_novel_title_selection(self, *_):
         self.backend.save()
 
+        self.jobs.cancel('chapter')
+        self.jobs.cancel('check')
+        self.prefetch_jobs.cancel('previous')
+        self.prefetch_jobs.cancel('next')
+
+        # The old novel's chapters can't be picked while the new one is read
+        self.chapter_info = []
+        self.chapter_selector.delete_all()
+
         novel_title = self.novel_selector.get()
         if novel_title:
-            self.chapter_selector.set_options(get_novel_chapter_titles(novel_title))
-            self.backend.load_novel(novel_title)
+            self.jobs.submit('novel', self._read_novel, novel_title,
+                             on_done=functools.partial(self._show_novel, novel_title))
         else:
-            self.chapter_selector.delete_all()
+            self.jobs.cancel('novel')
+
+    @staticmethod
+    def _read_novel(novel_title):
+        """ Runs in the background, so it only reads and leaves opening the novel to _show_novel() """
+        return Backend.read_novel(novel_title), get_chapter_info(novel_title)
+
+    def _show_novel(self, novel_title, result):
+        local_words, chapter_info = result
+        self.backend.load_novel(novel_title, local_words)
+        self.chapter_info = chapter_info
+        self.chapter_selector.set_options([info['chapter_title'] for info in self.chapter_info])
 
     def on_chapter_title_selection(self, *_):
         self.backend.save()
 
-        novel_title = self.novel_selector.get()
-        chapter_title = self.chapter_selector.get_value()
-        if novel_title and chapter_title:
+        novel_title = self.backend.novel_title
+        selection = self.chapter_selector.get()
+        if novel_title and selection and self.chapter_info:
+            # Look the chapter up by position since titles may be repeated
+            chapter_info = self.chapter_info[selection[0]]
+            chapter_title = chapter_info['chapter_title']
             self.log.debug(f"Loading chapter '{chapter_title}' from novel '{novel_title}'")
-            chapter_text = self.backend.load_chapter(chapter_title)
-            self.chapter_text.set(chapter_text)
+            self.jobs.cancel('check')
+
+            remembered = self.backend.recall_chapter(novel_title, chapter_info['name_index'])
+            if remembered is not None:
+                self.jobs.cancel('chapter')
+                self._show_chapter(chapter_title, *remembered)
+                return
+
+            # Chapters clicked through quickly replace each other's jobs, so only the last is shown
+            self.jobs.submit('chapter', self.backend.read_chapter, novel_title, chapter_title,
+                             chapter_info['name_index'], on_done=functools.partial(self._show_chapter, chapter_title))
 
-            errors = self.backend.potential_errors
-            for start_index, end_index in errors:
-                self.chapter_text.mark_incorrect(to_tk_index(chapter_text, start_index),
-                                                 to_tk_index(chapter_text, end_index))
+    def _show_chapter(self, chapter_title, edit_tracker, potential_errors=None):
+        """ Show the text of a chapter straight away and mark its potential errors once they've been found """
+        self.backend.show_chapter(chapter_title, edit_tracker, potential_errors)
+        self.chapter_text.set(self.backend.chapter_text)
+        if potential_errors is None:
+            self._check_chapter()
+        else:
+            self.chapter_text.mark_all_incorrect(potential_errors)
+        self._prefetch_neighbours()
+
+    def _prefetch_neighbours(self):
+        """ Load the chapters either side of the selected one in the background, ready for _prev and _next """
+        novel_title = self.backend.novel_title
+        selection = self.chapter_selector.get()
+        if not novel_title or not selection:
+            return
+
+        for name, position in (('previous', selection[0] - 1), ('next', selection[0] + 1)):
+            if not 0 <= position < len(self.chapter_info):
+                continue
+            chapter_info = self.chapter_info[position]
+            if self.backend.is_remembered(novel_title, chapter_info['name_index']):
+                continue
+            self.prefetch_jobs.submit(name, self.backend.prefetch_chapter, novel_title, chapter_info['chapter_title'],
+                                      chapter_info['name_index'], on_done=self._remember_prefetched)
+
+    def _remember_prefetched(self, result):
+        self.backend.remember_chapter(*result)
+
+    def _check_chapter(self):
+        self.jobs.submit('check', self.backend.prepare_check(), on_done=self._show_potential_errors)
+
+    def _show_potential_errors(self, result):
+        text_version, potential_errors = result
+        if self.backend.set_potential_errors(text_version, potential_errors):
+            self.chapter_text.mark_all_incorrect(potential_errors)
+        else:
+            # The text was edited while it was being checked
+            self._check_chapter()
 
     def create_selector_widget(self):
         chapter_select_frame = ttk.Frame(self)
@@ -70,7 +141,7 @@ class EditorPanel(ttk.Frame):
         self.novel_selector.pack(
             side=tk.TOP, fill=tk.X, expand=False)
 
-        self.chapter_selector = ScrollableListBox(chapter_select_frame, display_rows=20)
+        self.chapter_selector = ScrollableListBox(chapter_select_frame, display_rows=20, searchable=True)
         self.chapter_selector.pack(
             side=tk.TOP, fill=tk.BOTH, expand=True)
 
@@ -80,16 +151,24 @@ class EditorPanel(ttk.Frame):
 
     def _undo(self, *_):
         self.log.debug('Undo')
-        self.backend.undo()
-        self.chapter_text.set(self.backend.chapter_text)
+        self._apply_history_change(self.backend.undo())
         return "break"
 
     def _redo(self, *_):
         self.log.debug('Redo')
-        self.backend.redo()
-        self.chapter_text.set(self.backend.chapter_text)
+        self._apply_history_change(self.backend.redo())
         return "break"
 
+    def _apply_history_change(self, result):
+        """ Make the change returned by an undo or redo in the text box, rather than reloading the whole text """
+        if result is None:
+            return
+
+        change, added, removed = result
+        start_idx = change["start_idx"]
+        self.chapter_text.replace(start_idx, start_idx + len(change["old_text"]), change["new_text"])
+        self._update_marks(added, removed)
+
     def _save(self, *_):
         self.log.debug('Save')
         self.backend.save()
@@ -143,8 +222,7 @@ class EditorPanel(ttk.Frame):
         ttk.Button(edit_options_frame, text='Next', command=self._next).grid(
             row=0, column=4, padx=5, pady=5)
 
-        self.chapter_text.textbox.bind("<<Modified>>", self.on_text_change)
-        # self.chapter_text.textbox.bind("<<Paste>>", self.on_text_change)
+        self.chapter_text.on_edit = self.on_edit
 
         # Create the context menu
         self.context_menu = tk.Menu(self, tearoff=0)
@@ -173,25 +251,19 @@ class EditorPanel(ttk.Frame):
         finally:
             self.context_menu.grab_release()
 
-    def on_text_change(self, event=None):
-        self.log.debug(f"Modified: {event}")
-        widget = event.widget
-        if widget.edit_modified():
-            widget.edit_modified(False)  # reset flag
-
-        new_text = self.chapter_text.get()
-        old_text = self.backend.chapter_text
-
-        if new_text == old_text:
-            return  # No change
-
-        matcher = difflib.SequenceMatcher(None, old_text, new_text)
-        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
-            if tag in ("replace", "delete", "insert"):
-                self.log.debug(f"Detected change '{tag}'")
-                self.backend.make_edit(
-                    start_idx=i1,
-                    end_idx=i2,
-                    new_text=new_text[j1:j2],
-                )
-                break  # Only handle the first meaningful change
+    def on_edit(self, start_idx: int, end_idx: int, new_text: str):
+        """ Record a change made in the text box and update the error marks around it """
+        self.log.debug(f"Edit {start_idx, end_idx} -> {new_text!r}")
+        if not self.novel_selector.get() or self.edit_tracker.text is None:
+            return
+
+        added, removed = self.backend.make_edit(start_idx, end_idx, new_text)
+        self._update_marks(added, removed)
+
+    def _update_marks(self, added, removed):
+        for start_index, end_index in removed:
+            self.chapter_text.unmark_incorrect(self.chapter_text.tk_index(start_index),
+                                               self.chapter_text.tk_index(end_index))
+        for start_index, end_index in added:
+            self.chapter_text.mark_incorrect(self.chapter_text.tk_index(start_index),
+                                             self.chapter_text.tk_index(end_index))
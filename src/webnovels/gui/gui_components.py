@@ -1,19 +1,40 @@
 import logging
 import tkinter as tk
+from contextlib import contextmanager
 from tkinter import font, ttk
+from typing import Callable
 
 from webnovels.gui.backend import Backend
-from webnovels.utils import WHITESPACE
+from webnovels.utils import LineIndex, WHITESPACE
 
 
 class ScrollableListBox(ttk.Frame):
-    def __init__(self, *args, display_rows, width=30, text_options=None, **kwargs):
+    """ A list of options, optionally with a search box above it which filters the list as you type
+
+    Indices passed to and returned from set() and get() are positions in the full list of options, whatever
+    the filter is showing.
+    """
+
+    def __init__(self, *args, display_rows, width=30, text_options=None, searchable=False, **kwargs):
         super().__init__(*args, **kwargs)
         self.log = logging.getLogger(self.__class__.__name__)
 
         if text_options is None:
             text_options = []
 
+        self._options = []
+        self._folded = []  # The options casefolded ahead of time to search through
+        self._shown = []  # Index into the options of each row shown
+        self._query = []
+
+        # Create search box
+        self.search_text = tk.StringVar(self)
+        if searchable:
+            search_box = ttk.Entry(self, textvariable=self.search_text)
+            search_box.pack(side="top", fill="x")
+            search_box.bind("<Return>", self._select_first_match)
+            self.search_text.trace_add("write", lambda *_: self._filter())
+
         # Create Listbox
         self.listbox = tk.Listbox(self, height=display_rows, width=width,
                                   selectmode=tk.SINGLE,
@@ -30,32 +51,65 @@ class ScrollableListBox(ttk.Frame):
         self.listbox.config(yscrollcommand=scrollbar.set)
 
     def delete_all(self):
-        self.listbox.delete(0, tk.END)
+        self.set_options([])
 
     def get_options(self):
-        return self.listbox.get(0, tk.END)
+        return tuple(self._options)
 
     def set_options(self, text_options):
-        self.delete_all()
-        for item in text_options:
-            self.listbox.insert(tk.END, item)
+        self._options = list(text_options)
+        self._folded = [option.casefold() for option in self._options]
+        self._query = []
+        self.listbox.selection_clear(0, tk.END)
+        self._filter()
+
+    def _filter(self):
+        """ Show the options containing every word of the search text """
+        query = self.search_text.get().casefold().split()
+        if not query:
+            shown = list(range(len(self._options)))
+        else:
+            # Typing more can only narrow the matches, so only the options already shown need searching
+            narrowing = self._query and all(any(old in new for new in query) for old in self._query)
+            candidates = self._shown if narrowing else range(len(self._options))
+            shown = [i for i in candidates if all(word in self._folded[i] for word in query)]
+        self._query = query
+
+        selected = self.get()
+        self._shown = shown
+        # One call for every row, rather than one per row
+        self.listbox.delete(0, tk.END)
+        self.listbox.insert(tk.END, *(self._options[i] for i in shown))
+        if selected and selected[0] in shown:
+            self._select_row(shown.index(selected[0]))
+
+    def _select_first_match(self, *_):
+        if self._shown:
+            self.set(self._shown[0])
+            self.listbox.event_generate("<<ListboxSelect>>")
 
     def get(self):
-        return self.listbox.curselection()
+        return tuple(self._shown[row] for row in self.listbox.curselection())
 
     def set(self, index):
+        if index not in self._shown:
+            self.search_text.set('')  # Show every option again
+        self._select_row(self._shown.index(index))
+
+    def _select_row(self, row):
         self.listbox.selection_clear(0, tk.END)
-        self.listbox.selection_set(index)
-        self.listbox.activate(index)
-        self.listbox.see(index)  # Scroll to the item if it's not visible
+        self.listbox.selection_set(row)
+        self.listbox.activate(row)
+        self.listbox.see(row)  # Scroll to the item if it's not visible
 
     def get_value(self):
-        selection = self.listbox.curselection()
+        selection = self.get()
         if selection:
-            return self.listbox.get(selection[0])
+            return self._options[selection[0]]
 
 
 class ScrollableTextBox(ttk.Frame):
+    MARK_BATCH_SIZE = 500  # Ranges tagged per Tk call when marking many at once
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -87,6 +141,93 @@ class ScrollableTextBox(ttk.Frame):
 
         self.whitespace = None
 
+        self._lines = LineIndex()  # Kept in step with the text by _proxy
+        self._pending_marks = []
+        self._mark_job = None
+
+        # Called with (start, end, new_text) as string indices for every change made to the text by the user
+        self.on_edit: Callable[[int, int, str], None] | None = None
+        self._report_edits = True
+
+        # Put _proxy in place of the widget's Tcl command, so every insert and delete passes through it whether
+        # it comes from a key binding, a paste or a method call
+        self._widget_command = f'{self.textbox._w}_widget'
+        self.tk.call('rename', self.textbox._w, self._widget_command)
+        self.tk.createcommand(self.textbox._w, self._proxy)
+
+    def _proxy(self, command, *args):
+        if command not in ('insert', 'delete', 'replace'):
+            return self.tk.call(self._widget_command, command, *args)
+
+        # Marks waiting to be applied are for the text as it is now
+        self._apply_pending_marks()
+
+        # Work out the string indices before the text changes under them
+        edits = self._resolve_edit(command, args)
+        result = self.tk.call(self._widget_command, command, *args)
+        for start, end, new_text in edits:
+            self._lines.replace(start, end, new_text)
+            if self.on_edit is not None and self._report_edits:
+                self.on_edit(start, end, new_text)
+        return result
+
+    def _offset(self, tk_index: str, length: int) -> int:
+        """ Convert a Tk index to a string index, clamped to the text since Tk has a newline after the end """
+        try:
+            offset = self._lines.to_str_index(self.tk.call(self._widget_command, 'index', tk_index))
+        except IndexError:
+            return length
+        return min(offset, length)
+
+    def _resolve_edit(self, command, args) -> list[tuple[int, int, str]]:
+        length = self._lines.length
+
+        if command == 'insert':
+            # insert index chars ?tagList chars tagList ...?
+            start = self._offset(args[0], length)
+            return [(start, start, ''.join(args[1::2]))]
+
+        if command == 'replace':
+            # replace index1 index2 chars ?tagList chars tagList ...?
+            start, end = self._offset(args[0], length), self._offset(args[1], length)
+            return [(start, max(start, end), ''.join(args[2::2]))]
+
+        # delete index1 ?index2 ...?, where an index1 without an index2 deletes one character
+        ranges = [(self._offset(args[i], length), self._offset(args[i + 1], length))
+                  for i in range(0, len(args) - 1, 2)]
+        if len(args) % 2:
+            start = self._offset(args[-1], length)
+            ranges.append((start, min(start + 1, length)))
+
+        # Tk sorts the ranges and merges those which overlap or touch before deleting any
+        merged = []
+        for start, end in sorted(ranges):
+            if start >= end:
+                continue
+            if merged and start <= merged[-1][1]:
+                merged[-1] = merged[-1][0], max(end, merged[-1][1])
+            else:
+                merged.append((start, end))
+        # Report later ranges first so the indices of earlier ones are still right
+        return [(start, end, '') for start, end in reversed(merged)]
+
+    @contextmanager
+    def _without_edit_reports(self):
+        """ For changes made by the program rather than the user """
+        self._report_edits = False
+        try:
+            yield
+        finally:
+            self._report_edits = True
+
+    def tk_index(self, index: int) -> str:
+        """ Convert a string index to a Tk index """
+        return self._lines.to_tk_index(index)
+
+    def str_index(self, tk_index: str) -> int:
+        """ Convert a Tk index to a string index """
+        return self._offset(tk_index, self._lines.length)
+
     def mark_incorrect(self, start_index: str, end_index: str):
         """ Mark a range of text in red font with an underline
 
@@ -97,6 +238,58 @@ class ScrollableTextBox(ttk.Frame):
         # Insert and apply the tag
         self.textbox.tag_add("red_underline", start_index, end_index)
 
+    def unmark_incorrect(self, start_index: str, end_index: str):
+        """ Remove the error marking from a range of text
+
+        Args:
+            start_index: a Tk style index for the start of the range
+            end_index: a Tk style index for the end of the range
+        """
+        self.textbox.tag_remove("red_underline", start_index, end_index)
+
+    def mark_all_incorrect(self, ranges: list[tuple[int, int]]):
+        """ Mark many ranges of text in red font with an underline
+
+        The ranges on screen are marked straight away and the rest in batches once the screen has been drawn,
+        so a long chapter can be read while its errors are still being marked.
+
+        Args:
+            ranges: the (start, end) string indices of each range
+        """
+        self._cancel_pending_marks()
+
+        top = self.str_index("@0,0")
+        bottom = self.str_index(f"@0,{self.textbox.winfo_height()} lineend")
+        on_screen = [(start, end) for start, end in ranges if start <= bottom and end >= top]
+        self._pending_marks = [(start, end) for start, end in ranges if start > bottom or end < top]
+
+        self._tag_ranges("red_underline", on_screen)
+        if self._pending_marks:
+            self._mark_job = self.after_idle(self._mark_next_batch)
+
+    def _tag_ranges(self, tag, ranges):
+        for i in range(0, len(ranges), self.MARK_BATCH_SIZE):
+            # tag add takes any number of index pairs
+            indices = [self.tk_index(idx) for span in ranges[i:i + self.MARK_BATCH_SIZE] for idx in span]
+            self.textbox.tag_add(tag, *indices)
+
+    def _mark_next_batch(self):
+        batch = self._pending_marks[:self.MARK_BATCH_SIZE]
+        self._pending_marks = self._pending_marks[self.MARK_BATCH_SIZE:]
+        self._tag_ranges("red_underline", batch)
+        self._mark_job = self.after_idle(self._mark_next_batch) if self._pending_marks else None
+
+    def _apply_pending_marks(self):
+        pending = self._pending_marks
+        self._cancel_pending_marks()
+        self._tag_ranges("red_underline", pending)
+
+    def _cancel_pending_marks(self):
+        if self._mark_job is not None:
+            self.after_cancel(self._mark_job)
+            self._mark_job = None
+        self._pending_marks = []
+
     def _move_text_cursor_to_event(self, event):
         self.textbox.focus_set()
 
@@ -141,6 +334,7 @@ class ScrollableTextBox(ttk.Frame):
         return self.textbox.get("1.0", "end-1c")
 
     def set(self, text):
+        self._cancel_pending_marks()
         self.clear()
         self.insert("1.0", text)
         self.whitespace = [w for w in WHITESPACE if w in text]
@@ -157,13 +351,25 @@ class ScrollableTextBox(ttk.Frame):
         "sel.first"	    Start of selected text
         "sel.last"	    End of selected text
         """
-        self.textbox.insert(index, text)
+        with self._without_edit_reports():
+            self.textbox.insert(index, text)
 
         self.textbox.tag_configure("spacing", spacing2=2, spacing3=8)
         self.textbox.tag_add("spacing", "1.0", "end")
 
     def delete(self, start_index, end_index):
-        self.textbox.delete(start_index, end_index)
+        with self._without_edit_reports():
+            self.textbox.delete(start_index, end_index)
+
+    def replace(self, start_idx: int, end_idx: int, text: str):
+        """ Replace the text between two string indices in place, leaving the view and the cursor where they are """
+        view = self.textbox.yview()[0]
+        start_index = self.tk_index(start_idx)
+        with self._without_edit_reports():
+            self.textbox.replace(start_index, self.tk_index(end_idx), text)
+
+        self.textbox.tag_add("spacing", start_index, f"{start_index} + {len(text)} chars")
+        self.textbox.yview_moveto(view)
 
     def clear(self):
         self.delete("1.0", "end")
@@ -0,0 +1,55 @@
+import logging
+import tkinter as tk
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+
+class JobRunner:
+    """ Runs slow work off the Tk main loop and calls back on the main loop with the result
+
+    Jobs are named, and a new job replaces any waiting under the same name: it's cancelled if it hasn't started
+    and its result is dropped if it has. Finished jobs are found by polling with after(), since Tk may only be
+    used from the thread running the main loop.
+    """
+    POLL_MS = 20
+
+    def __init__(self, widget: tk.Misc, max_workers: int = 1):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self._widget = widget
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gui-job')
+        self._jobs: dict[str, tuple[Future, Callable[[Any], None]]] = {}
+        self._poll_job = None
+
+    def submit(self, name: str, fn: Callable, *args, on_done: Callable[[Any], None]) -> Future:
+        """ Run fn(*args) in the background, then on_done(result) on the main loop """
+        self.cancel(name)
+        future = self._executor.submit(fn, *args)
+        self._jobs[name] = future, on_done
+        if self._poll_job is None:
+            self._poll_job = self._widget.after(self.POLL_MS, self._poll)
+        return future
+
+    def cancel(self, name: str):
+        if name in self._jobs:
+            future, _ = self._jobs.pop(name)
+            future.cancel()
+
+    def pending(self, name: str) -> bool:
+        return name in self._jobs
+
+    def _poll(self):
+        self._poll_job = None
+        for name, (future, on_done) in list(self._jobs.items()):
+            # Skip jobs still running, or replaced by a callback earlier in this poll
+            if not future.done() or self._jobs.get(name, (None,))[0] is not future:
+                continue
+            del self._jobs[name]
+
+            exc = future.exception()
+            if exc is not None:
+                self.log.error(f"Job '{name}' failed", exc_info=exc)
+                continue
+            on_done(future.result())
+
+        if self._jobs and self._poll_job is None:
+            self._poll_job = self._widget.after(self.POLL_MS, self._poll)
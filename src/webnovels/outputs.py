@@ -1,5 +1,42 @@
 """----- Create Document -----"""
+import argparse
+import hashlib
+import html
+import logging
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from importlib.metadata import version
+from pathlib import Path
+
 import docx
+import pypub
+from pypub.builder import jinja_env
+from pypub.factory import SimpleChapterFactory
+
+from webnovels.editing import EditTracker
+from webnovels.storage import get_chapter_store
+from webnovels.utils import CACHE_DIR, bounded_map, get_chapter_info, get_file_safe, get_novel_dir
+
+EPUB_CACHE_DIR = CACHE_DIR / 'epub'
+EPUB_RENDER_VERSION = 1  # Bump when rendering changes, so cached chapters are rendered again
+
+
+def get_chapter_dict(novel_title):
+    """ Collect the processed text of every chapter, read through the novel's chapter store """
+    edit_tracker = EditTracker()
+
+    chapter_dict = {}
+    for chapter_info in get_chapter_info(novel_title):
+        edit_tracker.load_chapter_index(novel_title, chapter_info['name_index'])
+        chapter_dict[chapter_info['name_index']] = {
+            'title': chapter_info['chapter_title'],
+            'url': chapter_info['url'],
+            'text': edit_tracker.processed_text.split('\n'),
+        }
+    return chapter_dict
+
 
 def create_docx(title, chapter_dict):
     document = docx.Document('StyleDoc.docx')
@@ -29,3 +66,142 @@ def create_docx(title, chapter_dict):
 
     document.save(f"{title}\\{title}.docx")
     print('Document successfully created!')
+
+
+# Inline tags are left in chapter text, e.g. <i>, and are kept while everything else is escaped
+ESCAPED_TAG_PATTERN = re.compile(r'&lt;(/?[a-z]{1,5})&gt;')
+
+
+def text_to_html(text: str) -> bytes:
+    """ Turn chapter text into a body of paragraphs, one per non-empty line """
+    paragraphs = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line:
+            line = ESCAPED_TAG_PATTERN.sub(r'<\1>', html.escape(line, quote=False))
+            paragraphs.append(f"<p>{line}</p>")
+    return f"<body>{''.join(paragraphs)}</body>".encode('utf-8')
+
+
+def chapter_key(book_title: str, chapter_title: str, text: str) -> str:
+    """ Identify everything a chapter's rendered XHTML depends on """
+    digest = hashlib.sha256()
+    for part in (str(EPUB_RENDER_VERSION), version('pypub3'), book_title, chapter_title, text):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def render_chapter(job: tuple[str, str, str]) -> bytes:
+    """ Render a chapter to XHTML the same way pypub does, from (book_title, chapter_title, text) """
+    book_title, chapter_title, text = job
+    chapter = pypub.Chapter(chapter_title, text_to_html(text))
+    spec = pypub.Epub(title=book_title)
+    template = jinja_env.get_template('page.xhtml.j2')
+    # Text chapters have no images to download, so there's no image directory
+    return SimpleChapterFactory().render(logging.getLogger('render_chapter'), chapter, '', template,
+                                         {'epub': spec, 'chapter': chapter})
+
+
+def _cache_fp(key: str) -> Path:
+    return EPUB_CACHE_DIR / key[:2] / f'{key}.xhtml'
+
+
+def _write_cached(key: str, xhtml: bytes):
+    cache_fp = _cache_fp(key)
+    cache_fp.parent.mkdir(parents=True, exist_ok=True)
+    tmp_fp = cache_fp.with_suffix('.tmp')
+    tmp_fp.write_bytes(xhtml)
+    tmp_fp.replace(cache_fp)
+
+
+def create_epub(novel_title, output_fp: Path = None, author='Unknown', workers: int = None) -> Path:
+    """ Build an EPUB of a novel from the processed text of its chapters
+
+    Each chapter's XHTML is cached under a hash of its content, so only chapters which have changed since the
+    last export are rendered, in a process pool. Chapters are written into the archive as they're ready
+    rather than collected in a build directory first.
+
+    Returns:
+        The path of the EPUB
+    """
+    log = logging.getLogger('create_epub')
+    workers = workers or os.cpu_count()
+    novel_dir = get_novel_dir(novel_title)
+    output_fp = output_fp or novel_dir / f'{get_file_safe(novel_title)}.epub'
+
+    store = get_chapter_store(novel_dir)
+    edit_tracker = EditTracker()
+    epub = pypub.Epub(title=novel_title, creator=author, publisher='')
+    builder = epub.builder
+
+    rendered = []  # (link, key) of each chapter sent for rendering, in the order they were sent
+    cached = 0
+    tmp_fp = output_fp.with_suffix('.epub.tmp')
+    with builder, zipfile.ZipFile(tmp_fp, 'w', zipfile.ZIP_DEFLATED) as archive:
+        # The mimetype must come first and uncompressed
+        build_dirs = builder.begin()
+        archive.write(Path(build_dirs.basedir) / 'mimetype', 'mimetype', zipfile.ZIP_STORED)
+
+        def render_jobs():
+            nonlocal cached
+            for chapter_info in get_chapter_info(novel_title):
+                name_index = chapter_info['name_index']
+                if not store.exists('raw_chapters', name_index):
+                    log.debug(f"Chapter {name_index} hasn't been parsed, skipping")
+                    continue
+
+                assignment = epub.assign_chapter()
+                chapter_title = chapter_info['chapter_title']
+                builder.chapters.append((assignment, pypub.Chapter(chapter_title, b'', chapter_info['url'])))
+
+                edit_tracker.load_chapter_index(novel_title, name_index)
+                text = edit_tracker.processed_text
+                key = chapter_key(novel_title, chapter_title, text)
+                if _cache_fp(key).exists():
+                    archive.write(_cache_fp(key), f'OEBPS/{assignment.link}')
+                    cached += 1
+                else:
+                    rendered.append((assignment.link, key))
+                    yield novel_title, chapter_title, text
+
+        if workers <= 1:
+            results = enumerate(map(render_chapter, render_jobs()))
+            _write_rendered(archive, rendered, results)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = bounded_map(executor, render_chapter, render_jobs(), max_pending=2 * workers)
+                _write_rendered(archive, rendered, results)
+
+        # The contents, styles and cover are small, so pypub builds them in its directory as usual
+        builder.index()
+        for root, _, filenames in os.walk(build_dirs.basedir):
+            for filename in filenames:
+                fp = Path(root) / filename
+                arcname = fp.relative_to(build_dirs.basedir).as_posix()
+                if arcname != 'mimetype':
+                    archive.write(fp, arcname)
+
+    tmp_fp.replace(output_fp)
+    log.info(f"Exported {len(builder.chapters)} chapters of '{novel_title}' to {output_fp}, "
+             f"rendered {len(rendered)} and reused {cached}")
+    return output_fp
+
+
+def _write_rendered(archive, rendered, results):
+    for position, xhtml in results:
+        link, key = rendered[position]
+        _write_cached(key, xhtml)
+        archive.writestr(f'OEBPS/{link}', xhtml)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export a novel as an EPUB")
+    parser.add_argument('title', help="Novel to export")
+    parser.add_argument('--output', type=Path, default=None, help="Where to write the EPUB")
+    parser.add_argument('--author', default='Unknown', help="Author shown on the cover")
+    parser.add_argument('--workers', type=int, default=None, help="Processes to render chapters with")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(create_epub(args.title, args.output, author=args.author, workers=args.workers))
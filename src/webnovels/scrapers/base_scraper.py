@@ -1,12 +1,39 @@
 import json
 import logging
+import os
 import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from typing import Iterator
+from urllib.parse import urljoin, urlparse
 
-from webnovels.utils import NOVELS_DIR, create_new_novel, get_file_safe
+from webnovels.catalog import get_chapter_catalog
+from webnovels.scrapers.cache import ResponseCache, get_response_cache
+from webnovels.scrapers.fetchers import BaseFetcher, FetchResult, HttpFetcher, fetch_all
+from webnovels.scrapers.manifest import ChapterManifest, ManifestEntry
+from webnovels.scrapers.throttling import FetchError, HostThrottle, RetryPolicy, get_host_throttle, parse_retry_after
+from webnovels.storage import get_chapter_store
+from webnovels.utils import CACHE_DIR, NOVELS_DIR, bounded_map, create_new_novel, get_file_safe, iter_in_thread
 
 
 class BaseScraper:
+    # How many pages may be requested from the site at once. The throttle starts lower and works up to this
+    MAX_CONCURRENT_REQUESTS = 4
+    # Requests per second to start at and never exceed, the throttle adapts between them
+    INITIAL_REQUEST_RATE = 2.0
+    MAX_REQUEST_RATE = 20.0
+    # Responses slower than this many seconds count as the site struggling
+    SLOW_RESPONSE = 10.0
+    RETRY_POLICY = RetryPolicy()
+    # How long cached pages of each type (see page_type) stay fresh, in seconds
+    CACHE_TTLS = {
+        'index': 60 * 60,
+        'chapter': 30 * 24 * 60 * 60,
+    }
+    CACHE_MAX_BYTES = 1024 ** 3
+    # How many processes parse chapters at once, parsing happens in this process if set to 1
+    PARSE_WORKERS = os.cpu_count() or 1
+
     def __init__(self, novel_url, novel_title):
         self.log = logging.getLogger(self.__class__.__name__)
         self.novel_url = novel_url
@@ -21,66 +48,307 @@ class BaseScraper:
             metadata['url'] = novel_url
             json.dumps(metadata, indent=2)
 
+        self.store = get_chapter_store(self.novel_dir)
+        self.catalog = get_chapter_catalog(self.novel_dir)
+        self.fetcher = self.create_fetcher()
+        self.throttle = self.create_throttle()
+        self.cache = self.create_cache()
+
+    def create_throttle(self) -> HostThrottle:
+        return get_host_throttle(urlparse(self.novel_url).netloc,
+                                 rate=self.INITIAL_REQUEST_RATE,
+                                 max_rate=self.MAX_REQUEST_RATE,
+                                 max_concurrency=self.MAX_CONCURRENT_REQUESTS,
+                                 slow_response=self.SLOW_RESPONSE)
+
+    def create_cache(self) -> ResponseCache | None:
+        return get_response_cache(CACHE_DIR / 'http', max_bytes=self.CACHE_MAX_BYTES)
+
+    def create_fetcher(self) -> BaseFetcher:
+        return HttpFetcher(pool_size=self.MAX_CONCURRENT_REQUESTS)
+
     def close(self):
-        pass
+        self.fetcher.close()
+        self.store.close()
+        if self.cache:
+            self.log.debug(f"Response cache: {self.cache.stats()}")
+
+    def page_type(self, url) -> str:
+        """ Classify a URL as one of the CACHE_TTLS page types """
+        return 'chapter'
+
+    def get_page(self, url, headers=None, refresh=False) -> FetchResult:
+        """ Fetch a page through the response cache and the host throttle
+
+        Conditional requests always go to the site, since they are asking whether the site's copy changed.
+
+        Args:
+            refresh: fetch the page from the site even if it's cached, and cache the new copy
+        """
+        if self.novel_url not in url:
+            url = urljoin(self.novel_url, url)
+
+        page_type = self.page_type(url)
+        if self.cache and not headers and not refresh:
+            cached = self.cache.get(url, ttl=self.CACHE_TTLS[page_type])
+            if cached is not None:
+                text, cached_headers = cached
+                return FetchResult(url, 200, text, cached_headers, 0.0)
+
+        self.throttle.acquire()
+        try:
+            result = self.fetcher.fetch(url, headers)
+        except Exception:
+            self.throttle.release()
+            raise
+
+        retry_after = parse_retry_after(result.headers.get('Retry-After'))
+        self.throttle.release(result.elapsed, result.status, retry_after)
+        if result.status >= 400:
+            raise FetchError(url, result.status, retry_after)
+
+        if self.cache and result.status == 200:
+            self.cache.put(url, page_type, result.text, result.headers)
+        return result
 
     def get(self, url):
-        raise NotImplementedError
+        return self.get_page(url).text
 
-    def get_chapters(self):
+    def fetch_all(self, urls):
+        for position, result in fetch_all(self.get, urls, max_workers=self.MAX_CONCURRENT_REQUESTS,
+                                          retry=self.RETRY_POLICY):
+            if isinstance(result, Exception):
+                raise result
+            yield position, result
+
+    def get_chapters(self, known_chapters: list[str] = None) -> list[str]:
+        """ Get the links of every chapter in reading order
+
+        Args:
+            known_chapters: the chapter links found by the last scrape, which scrapers may use to only
+                look for chapters added since
+        """
         raise NotImplementedError
 
-    def download_all_chapters(self, force=False):
-        # if not force and list((self.novel_dir / 'raw_html').glob('*.html')):
-        #     return
-        # for file in (self.novel_dir / 'raw_html').glob('*'):
-        #     file.unlink()
+    def _conditional_headers(self, entry: ManifestEntry | None):
+        headers = {}
+        if entry and self.fetcher.SUPPORTS_CONDITIONAL_REQUESTS:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def _get_chapter_data(self, force=False) -> list[dict]:
+        known_info = self.catalog.chapter_info()
+        known_titles = {info['url']: info['chapter_title'] for info in known_info}
+
+        known_chapters = None if force else [info['url'] for info in known_info]
 
-        chapter_links = self.get_chapters()
         chapter_data = []
-        for i, chapter_link in enumerate(chapter_links, start=1):
+        for i, chapter_link in enumerate(self.get_chapters(known_chapters), start=1):
             chapter_data.append({
                 'name_index': i,
                 'url': chapter_link,
-                'chapter_title': '',  # Placeholder
+                'chapter_title': known_titles.get(chapter_link, ''),  # Placeholder until parsed
             })
 
-            fname = f'{i}.html'
-            # with open(self.novel_dir / 'raw_html' / fname, 'w') as html_file:
-            #     html_file.write(self.get(chapter_link))
+        self.catalog.replace_all(chapter_data)
+        return chapter_data
+
+    def _download_chapters(self, chapter_data: list[dict], force=False,
+                           manifest: ChapterManifest = None) -> Iterator[tuple[dict, str]]:
+        """ Download every chapter which is new, failed last time or may have changed
+
+        Chapters fetched after the last completed scrape (i.e. by a run which crashed) are skipped, so an
+        interrupted scrape resumes where it stopped. Chapters from earlier scrapes are revalidated with a
+        conditional request when the fetcher supports them and skipped otherwise. Forced downloads and chapters
+        which failed last time bypass the response cache, since the cached copy may be the one which failed.
+
+        Yields the chapter info and page source of each chapter as it's stored.
+
+        Args:
+            chapter_data: the chapter info of every chapter in the novel
+            force: download every chapter again, ignoring the manifest
+            manifest: the novel's manifest, if the caller also records to it
+        """
+        with open(self.novel_dir / 'metadata.json', 'r') as metadata_file:
+            last_scrape_ts = json.load(metadata_file).get('last_chapter_scrape_ts', 0)
+
+        manifest = manifest or ChapterManifest(self.novel_dir)
+
+        to_download = []
+        for chapter_info in chapter_data:
+            i = chapter_info['name_index']
+            entry = manifest.get(chapter_info['url'])
+            if force or (entry is not None and entry['status'] != 'ok'):
+                to_download.append((chapter_info, None, True))
+            elif entry is None or entry['name_index'] != i or self.store.size('raw_html', i) != entry['size']:
+                to_download.append((chapter_info, None, False))
+            elif entry['fetch_ts'] > last_scrape_ts:
+                continue  # Already fetched by an interrupted run
+            elif self.fetcher.SUPPORTS_CONDITIONAL_REQUESTS:
+                to_download.append((chapter_info, entry, False))
+
+        self.log.debug(f"Downloading {len(to_download)}/{len(chapter_data)} chapters")
 
-            if bin(i).count('1') == 1:
-                self.log.debug(f"Downloaded {i}/{len(chapter_links)} chapters")
+        def download(item):
+            chapter_info, entry, refresh = item
+            return self.get_page(chapter_info['url'], self._conditional_headers(entry), refresh)
 
-        self.log.debug(f"Downloaded {i} chapters")
+        downloaded = unchanged = failed = 0
+        for position, result in fetch_all(download, to_download, max_workers=self.MAX_CONCURRENT_REQUESTS,
+                                          retry=self.RETRY_POLICY):
+            chapter_info = to_download[position][0]
+            i, url = chapter_info['name_index'], chapter_info['url']
 
-        chapter_data.sort(key=lambda info: info['name_index'])
+            if isinstance(result, Exception):
+                self.log.warning(f"Failed to download chapter {i} from '{url}': {result}")
+                manifest.record_failure(url, i, result)
+                failed += 1
+                continue
+
+            if result.status == 304:
+                manifest.record_unchanged(url)
+                unchanged += 1
+                continue
+
+            size = self.store.write('raw_html', i, result.text)
+            manifest.record_success(url, i, result.text, size, result.headers)
+            yield chapter_info, result.text
+
+            downloaded += 1
+            if bin(downloaded).count('1') == 1:
+                self.log.debug(f"Downloaded {downloaded}/{len(to_download)} chapters")
+
+        self.log.debug(f"Downloaded {downloaded} chapters, {unchanged} unchanged, {failed} failed")
+        manifest.compact()
+
+    def _finish_scrape(self):
         with open(self.novel_dir / 'metadata.json', 'r+') as metadata_file:
             metadata = json.load(metadata_file)
-            metadata['chapter_info'] = chapter_data
-
             metadata['last_chapter_scrape_ts'] = time.time()
             metadata['last_chapter_scrape'] = datetime.now().isoformat()
 
             metadata_file.seek(0)
             json.dump(metadata, metadata_file, indent=2)
+            metadata_file.truncate()
+
+    def download_all_chapters(self, force=False):
+        chapter_data = self._get_chapter_data(force)
+        for _ in self._download_chapters(chapter_data, force):
+            pass
+        self._finish_scrape()
+
+    def scrape(self, force=False):
+        """ Download and parse every chapter in one pass
+
+        Downloads run on a background thread and hand each page to the parse stage through a bounded queue,
+        so parsing overlaps network I/O and pages are never read back from disk. Parsed text and titles are
+        stored as soon as each chapter is ready.
+
+        Chapters which were downloaded but never parsed, e.g. by a run which crashed in between, are read
+        back from the store and parsed once the downloads are done. A chapter which fails to parse is marked
+        as failed in the manifest, so it's downloaded again by the next scrape, and the rest carry on.
+
+        Args:
+            force: download every chapter again, ignoring the manifest
+        """
+        chapter_data = self._get_chapter_data(force)
+        manifest = ChapterManifest(self.novel_dir)
+
+        # Untitled chapters have never been parsed, the title is only stored along with the text
+        unparsed = [chapter_info for chapter_info in chapter_data
+                    if self.store.exists('raw_html', chapter_info['name_index'])
+                    and not (chapter_info['chapter_title']
+                             and self.store.exists('raw_chapters', chapter_info['name_index']))]
+
+        downloads = iter_in_thread(self._download_chapters(chapter_data, force, manifest),
+                                   maxsize=2 * self.PARSE_WORKERS)
+        arrived = []
+
+        def pages():
+            for chapter_info, chapter_html in downloads:
+                arrived.append(chapter_info)
+                yield chapter_html
+
+            downloaded = {chapter_info['name_index'] for chapter_info in arrived}
+            for chapter_info in unparsed:
+                if chapter_info['name_index'] not in downloaded:
+                    arrived.append(chapter_info)
+                    yield self.store.read('raw_html', chapter_info['name_index'])
+
+        parsed = failed = 0
+        for position, result in self.parse_all(pages()):
+            chapter_info = arrived[position]
+            i, url = chapter_info['name_index'], chapter_info['url']
+            if isinstance(result, Exception):
+                self.log.warning(f"Failed to parse chapter {i} from '{url}': {result}")
+                manifest.record_failure(url, i, result)
+                failed += 1
+                continue
+
+            chapter_title, page_text = result
+            self.store.write('raw_chapters', i, page_text)
+            self.catalog.set_parsed({i: (chapter_title, len(page_text.split()))})
+            parsed += 1
+
+        self.log.debug(f"Parsed {parsed} chapters, {failed} failed")
+        self._finish_scrape()
 
     def get_page_text(self):
         raise NotImplementedError
 
-    def parse_chapter(self, chapter_html: str, fname: str) -> str:
+    @classmethod
+    def parse_chapter(cls, chapter_html: str) -> tuple[str, str]:
+        """ Extract the chapter title and text from a chapter page
+
+        This runs in worker processes, so it must not rely on any scraper instance state.
+        """
         raise NotImplementedError
 
+    @classmethod
+    def _try_parse_chapter(cls, chapter_html: str) -> tuple[str, str] | Exception:
+        """ parse_chapter(), but returning the error if it fails so one bad page doesn't stop the rest """
+        try:
+            return cls.parse_chapter(chapter_html)
+        except Exception as exc:
+            # Not every exception survives being pickled back from a worker process
+            return RuntimeError(f"{exc.__class__.__name__}: {exc}")
+
+    def parse_all(self, pages):
+        """ Parse pages, yielding (position, result) pairs where the result is the title and text of the
+        chapter or the error parsing it raised
+        """
+        if self.PARSE_WORKERS <= 1:
+            for i, page in enumerate(pages):
+                yield i, self._try_parse_chapter(page)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.PARSE_WORKERS) as executor:
+            yield from bounded_map(executor, self._try_parse_chapter, pages, max_pending=2 * self.PARSE_WORKERS)
+
     def parse_all_chapters(self):
-        with open(self.novel_dir / 'metadata.json', 'r') as metadata_file:
-            metadata = json.load(metadata_file)
+        chapter_info_list = []
+        for chapter_info in self.catalog.chapter_info():
+            if self.store.exists('raw_html', chapter_info['name_index']):
+                chapter_info_list.append(chapter_info)
+            else:
+                self.log.warning(f"Chapter {chapter_info['name_index']} hasn't been downloaded, skipping")
 
-        for chapter_info in metadata['chapter_info']:
-            i = chapter_info['name_index']
+        parsed = {}
+        pages = (self.store.read('raw_html', chapter_info['name_index']) for chapter_info in chapter_info_list)
+        for position, result in self.parse_all(pages):
+            name_index = chapter_info_list[position]['name_index']
+            if isinstance(result, Exception):
+                self.log.warning(f"Failed to parse chapter {name_index}: {result}")
+                continue
 
-            with open(self.novel_dir / 'raw_html' / f'{i}.html', 'r') as html_file:
-                response = html_file.read()
-            chapter_info['chapter_title'] = self.parse_chapter(response, f'{i}.txt')
+            chapter_title, page_text = result
+            self.store.write('raw_chapters', name_index, page_text)
+            parsed[name_index] = chapter_title, len(page_text.split())
 
-        with open(self.novel_dir / 'metadata.json', 'w') as metadata_file:
-            json.dump(metadata, metadata_file, indent=2)
+        self.log.debug(f"Parsed {len(parsed)}/{len(chapter_info_list)} chapters")
+
+        # Titles are collected above and written in one transaction
+        self.catalog.set_parsed(parsed)
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Response headers worth keeping, the rest describe the original transfer
+CACHED_HEADERS = ('ETag', 'Last-Modified', 'Content-Type')
+
+
+def normalize_url(url: str) -> str:
+    """ Reduce equivalent URLs to one form, e.g. sorted query parameters and no fragment """
+    parts = urlsplit(url)
+    netloc = parts.hostname or ''
+    if parts.port and (parts.scheme, parts.port) not in (('http', 80), ('https', 443)):
+        netloc += f':{parts.port}'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), netloc.lower(), parts.path or '/', query, ''))
+
+
+class ResponseCache:
+    """ A size-bounded disk cache of page responses keyed by normalized URL
+
+    Page bodies are stored compressed under the hash of their content, so identical pages share one blob.
+    An SQLite index maps URLs to blobs and records when each was stored and last used. Entries older than
+    the TTL for their page type are ignored, and the least recently used entries are evicted once the blobs
+    take up more than max_bytes.
+    """
+    INDEX_FILENAME = 'index.sqlite'
+
+    def __init__(self, cache_dir: Path, max_bytes: int = 1024 ** 3):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.cache_dir = cache_dir
+        self.blob_dir = cache_dir / 'blobs'
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(cache_dir / self.INDEX_FILENAME, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    url_key TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    page_type TEXT NOT NULL,
+                    stored_ts REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    headers TEXT NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_content_hash ON entries (content_hash)")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    content_hash TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL
+                )
+            """)
+        self._total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def _blob_fp(self, content_hash):
+        return self.blob_dir / content_hash[:2] / content_hash
+
+    def get(self, url: str, ttl: float) -> tuple[str, dict[str, str]] | None:
+        """ Get the cached body and headers for a URL, or None if it's missing or older than ttl seconds """
+        url_key = normalize_url(url)
+        with self._lock:
+            row = self._db.execute("SELECT content_hash, stored_ts, headers FROM entries WHERE url_key = ?",
+                                   (url_key,)).fetchone()
+            if row is None or time.time() - row[1] > ttl:
+                self.misses += 1
+                return None
+
+            content_hash, _, headers = row
+            try:
+                blob = self._blob_fp(content_hash).read_bytes()
+            except FileNotFoundError:
+                self.log.warning(f"Cache blob {content_hash} is missing, dropping '{url_key}'")
+                with self._db:
+                    self._db.execute("DELETE FROM entries WHERE url_key = ?", (url_key,))
+                self.misses += 1
+                return None
+
+            with self._db:
+                self._db.execute("UPDATE entries SET last_access = ? WHERE url_key = ?", (time.time(), url_key))
+            self.hits += 1
+
+        return zlib.decompress(blob).decode('utf-8'), json.loads(headers)
+
+    def put(self, url: str, page_type: str, text: str, headers):
+        url_key = normalize_url(url)
+        data = text.encode('utf-8')
+        content_hash = hashlib.sha256(data).hexdigest()
+        kept_headers = {name: headers[name] for name in CACHED_HEADERS if headers.get(name)}
+
+        with self._lock:
+            new_blob = self._db.execute("SELECT 1 FROM blobs WHERE content_hash = ?",
+                                        (content_hash,)).fetchone() is None
+            if new_blob:
+                blob = zlib.compress(data)
+                blob_fp = self._blob_fp(content_hash)
+                blob_fp.parent.mkdir(exist_ok=True)
+                tmp_fp = blob_fp.with_suffix('.tmp')
+                tmp_fp.write_bytes(blob)
+                tmp_fp.replace(blob_fp)
+
+            previous = self._db.execute("SELECT content_hash FROM entries WHERE url_key = ?", (url_key,)).fetchone()
+            now = time.time()
+            with self._db:
+                if new_blob:
+                    self._db.execute("INSERT INTO blobs VALUES (?, ?)", (content_hash, len(blob)))
+                    self._total_bytes += len(blob)
+                self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                                 (url_key, content_hash, page_type, now, now, json.dumps(kept_headers)))
+            if previous and previous[0] != content_hash:
+                self._drop_unreferenced([previous[0]])
+
+            self._evict()
+
+    def _drop_unreferenced(self, content_hashes):
+        for content_hash in content_hashes:
+            if self._db.execute("SELECT 1 FROM entries WHERE content_hash = ? LIMIT 1", (content_hash,)).fetchone():
+                continue
+            row = self._db.execute("SELECT size FROM blobs WHERE content_hash = ?", (content_hash,)).fetchone()
+            if row is None:
+                continue
+            with self._db:
+                self._db.execute("DELETE FROM blobs WHERE content_hash = ?", (content_hash,))
+            self._total_bytes -= row[0]
+            self._blob_fp(content_hash).unlink(missing_ok=True)
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes:
+            rows = self._db.execute("SELECT url_key, content_hash FROM entries ORDER BY last_access LIMIT 10").fetchall()
+            if not rows:
+                break
+            with self._db:
+                self._db.executemany("DELETE FROM entries WHERE url_key = ?", [(url_key,) for url_key, _ in rows])
+            self._drop_unreferenced({content_hash for _, content_hash in rows})
+            self.log.debug(f"Evicted {len(rows)} entries, cache is {self._total_bytes} bytes")
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': entries,
+                'bytes': self._total_bytes,
+            }
+
+
+_caches: dict[Path, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(cache_dir: Path, max_bytes: int = 1024 ** 3) -> ResponseCache:
+    """ Get the cache shared by every scraper using cache_dir """
+    with _caches_lock:
+        if cache_dir not in _caches:
+            _caches[cache_dir] = ResponseCache(cache_dir, max_bytes)
+        return _caches[cache_dir]
@@ -0,0 +1,250 @@
+import heapq
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Mapping, NamedTuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from webnovels.scrapers.throttling import RetryPolicy
+
+Locator = tuple[str, str]
+
+
+class FetchResult(NamedTuple):
+    url: str
+    status: int
+    text: str
+    headers: Mapping[str, str]  # Case-insensitive for HTTP responses
+    elapsed: float  # Seconds between sending the request and receiving the full response
+
+
+class BaseFetcher:
+    """ A backend which knows how to turn a URL into page source """
+    # Whether If-None-Match/If-Modified-Since headers are sent and a 304 can come back
+    SUPPORTS_CONDITIONAL_REQUESTS = False
+
+    def __init__(self):
+        self.log = logging.getLogger(self.__class__.__name__)
+
+    def fetch(self, url: str, headers: dict[str, str] = None) -> FetchResult:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class HttpFetcher(BaseFetcher):
+    """ Plain HTTP backend for sites which don't need JavaScript
+
+    A single session is shared between worker threads. Its connection pool is sized to the number of
+    concurrent requests so every worker keeps its own keep-alive connection instead of reconnecting.
+    """
+    DEFAULT_HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                      'Chrome/124.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    }
+    SUPPORTS_CONDITIONAL_REQUESTS = True
+
+    def __init__(self, pool_size: int = 10, timeout: float = 30):
+        super().__init__()
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers.update(self.DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def fetch(self, url, headers=None):
+        start = time.monotonic()
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        return FetchResult(url, response.status_code, response.text, response.headers,
+                           time.monotonic() - start)
+
+    def close(self):
+        self.session.close()
+
+
+class WebDriverFetcher(BaseFetcher):
+    """ Headless Chrome backend for sites which render their content with JavaScript
+
+    Keeps a pool of up to pool_size browsers which worker threads check out for one page at a time. A page
+    is returned as soon as any of the ready_locators is present rather than after a fixed delay, and
+    images, stylesheets and fonts are never downloaded since only the page text is used.
+    """
+    BLOCKED_URLS = [
+        '*.css', '*.woff', '*.woff2', '*.ttf', '*.otf',
+        '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico',
+    ]
+
+    def __init__(self, driver_path: Path, pool_size: int = 1, ready_locators: list[Locator] = None,
+                 timeout: float = 10):
+        super().__init__()
+        self.driver_path = driver_path
+        self.pool_size = pool_size
+        self.ready_locators = ready_locators or []
+        self.timeout = timeout
+
+        self._drivers = []
+        self._idle_drivers = queue.Queue()
+        self._lock = threading.Lock()
+
+    def _create_driver(self):
+        service = Service(self.driver_path)
+        options = webdriver.ChromeOptions()
+        options.add_argument("--headless")
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.stylesheets": 2,
+        })
+        # Return from get() once the DOM is parsed instead of waiting for every subresource
+        options.page_load_strategy = "eager"
+
+        driver = webdriver.Chrome(service=service, options=options)
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": self.BLOCKED_URLS})
+        self.log.debug(f"Started driver {len(self._drivers) + 1}/{self.pool_size}")
+        return driver
+
+    def _get_driver(self):
+        while True:
+            try:
+                driver = self._idle_drivers.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    if len(self._drivers) < self.pool_size:
+                        driver = self._create_driver()
+                        self._drivers.append(driver)
+                        return driver
+                driver = self._idle_drivers.get()
+
+            if driver is not None:
+                return driver
+            # None marks the place of a discarded driver, which another thread may have replaced already
+
+    def _discard(self, driver):
+        with self._lock:
+            self._drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception as exc:
+            self.log.warning(f"Failed to quit discarded driver: {exc}")
+        finally:
+            # Wake a thread waiting for a driver, so it starts a replacement
+            self._idle_drivers.put(None)
+
+    @contextmanager
+    def _checkout(self):
+        """ Lend a driver from the pool, which always either goes back to the pool or is quit and replaced """
+        driver = self._get_driver()
+        try:
+            yield driver
+        except WebDriverException as exc:
+            if isinstance(exc, TimeoutException):
+                self._idle_drivers.put(driver)
+            else:
+                # The browser may have crashed, so replace it rather than handing it to another worker
+                self.log.warning(f"Discarding driver after error: {exc.msg}")
+                self._discard(driver)
+            raise
+        except Exception:
+            # Not the browser's fault, e.g. an error handling the page
+            self._idle_drivers.put(driver)
+            raise
+        except BaseException:
+            # Interrupted part way through a command, so the browser may be in any state
+            self._discard(driver)
+            raise
+        else:
+            self._idle_drivers.put(driver)
+
+    def fetch(self, url, headers=None):
+        with self._checkout() as driver:
+            start = time.monotonic()
+            driver.get(url)
+
+            if self.ready_locators:
+                wait = WebDriverWait(driver, self.timeout)
+                wait.until(EC.any_of(*[EC.presence_of_element_located(locator) for locator in self.ready_locators]))
+
+            # The WebDriver API doesn't expose response codes
+            return FetchResult(url, 200, driver.page_source, {}, time.monotonic() - start)
+
+    def close(self):
+        with self._lock:
+            for driver in self._drivers:
+                driver.quit()
+            self._drivers.clear()
+
+
+def fetch_all(fetch: Callable[[Any], Any], items: Iterable, max_workers: int = 1,
+              retry: RetryPolicy = None) -> Iterator[tuple[int, Any]]:
+    """ Call fetch on every item with at most max_workers calls in flight
+
+    Results are yielded as (position, result) pairs in completion order, so callers must use the
+    position rather than the iteration order to match a result to its item. Only max_workers items are
+    submitted at a time, which keeps memory flat no matter how many items there are.
+
+    Items whose fetch raised are put back in the queue after the delay given by the retry policy and
+    other items are fetched in the meantime. Once an item can't be retried its exception is yielded as
+    the result. Without a retry policy the first exception is raised.
+
+    Args:
+        fetch: called with each item, usually a URL, and returns the page
+        items: the URLs or other work items to fetch
+        max_workers: the maximum number of concurrent calls to fetch
+        retry: how to retry failed items
+    """
+    item_iter = enumerate(items)
+    pending = {}  # future -> (position, item, attempt)
+    retries = []  # heap of (ready time, position, item, attempt)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetch') as executor:
+        def fill():
+            while len(pending) < max_workers:
+                if retries and retries[0][0] <= time.monotonic():
+                    _, position, item, attempt = heapq.heappop(retries)
+                elif (next_item := next(item_iter, None)) is not None:
+                    (position, item), attempt = next_item, 0
+                else:
+                    return
+                pending[executor.submit(fetch, item)] = position, item, attempt
+
+        fill()
+        while pending or retries:
+            timeout = max(0.0, retries[0][0] - time.monotonic()) if retries else None
+            if pending:
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            else:
+                time.sleep(timeout)
+                done = set()
+
+            for future in done:
+                position, item, attempt = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    if retry is None:
+                        raise
+                    if retry.should_retry(exc, attempt):
+                        delay = retry.delay(exc, attempt)
+                        logging.getLogger('fetch_all').debug(f"Retrying {item!r} in {delay:.1f}s after: {exc}")
+                        heapq.heappush(retries, (time.monotonic() + delay, position, item, attempt + 1))
+                        continue
+                    result = exc
+                yield position, result
+
+            fill()
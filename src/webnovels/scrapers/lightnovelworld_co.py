@@ -1,67 +1,130 @@
-import time
 from pathlib import Path
-from urllib.parse import urljoin
+from urllib.parse import urlparse
 
 from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.by import By
 
 from .base_scraper import BaseScraper
+from .fetchers import WebDriverFetcher
 
+try:
+    from lxml import etree, html as lxml_html
+except ImportError:
+    etree = lxml_html = None
+
+CHAPTER_TITLE_XPATH = '//span[contains(concat(" ", normalize-space(@class), " "), " chapter-title ")]'
+CHAPTER_CONTAINER_XPATH = '//div[@id="chapter-container"]'
 
-class LightNovelWorldScraper(BaseScraper):
-    def __init__(self, novel_url, novel_name):
-        super().__init__(novel_url, novel_name)
 
+class LightNovelWorldScraper(BaseScraper):
+    # Pages are rendered by JavaScript, so each concurrent request gets its own headless browser
+    MAX_CONCURRENT_REQUESTS = 4
+    # Browser page loads are heavy, so start gently
+    INITIAL_REQUEST_RATE = 0.5
+    MAX_REQUEST_RATE = 5.0
+
+    # A page is ready once either chapter text or an index listing has been rendered
+    READY_LOCATORS = [
+        (By.ID, 'chapter-container'),
+        (By.CLASS_NAME, 'chapter-list'),
+    ]
+
+    def create_fetcher(self):
         driver_path = Path(r"D:\Daniel Davis\Documents\Webdrivers\chromedriver-win64\chromedriver.exe").resolve()
-        service = Service(driver_path)
-        options = webdriver.ChromeOptions()
-        options.add_argument("--headless")
+        return WebDriverFetcher(driver_path, pool_size=self.MAX_CONCURRENT_REQUESTS,
+                                ready_locators=self.READY_LOCATORS)
 
-        self.driver = webdriver.Chrome(service=service, options=options)
+    def page_type(self, url):
+        if urlparse(url).path.rstrip('/').endswith('/chapters'):
+            return 'index'
+        return 'chapter'
 
-    def close(self):
-        self.driver.quit()
+    @staticmethod
+    def _parse_index_page(response) -> tuple[list[str], list[int]]:
+        """ Get the chapter links and the visible pagination page numbers from an index page """
+        index_soup = BeautifulSoup(response, 'html.parser')
 
-    def get(self, url):
-        if self.novel_url not in url:
-            url = urljoin(self.novel_url, url)
-        self.driver.get(url)
+        chapters = []
+        ul_soup = index_soup.find('ul', class_='chapter-list')
+        if ul_soup:
+            chapters = [chapter_link['href'] for chapter_link in ul_soup.find_all('a', href=True)]
 
-        time.sleep(2)
-        # TODO
-        # wait = WebDriverWait(self.driver, 10)  # Wait up to 10 seconds
-        # wait.until(EC.presence_of_element_located((By.CLASS_NAME, 'chapter-list')))
+        page_numbers = []
+        tabs = index_soup.find('ul', class_='pagination')
+        if tabs:
+            page_numbers = [int(span.text) for span in tabs.find_all('li') if span.text.strip().isdigit()]
 
-        return self.driver.page_source
+        return chapters, page_numbers
 
-    def get_chapters(self):
+    def get_chapters(self, known_chapters=None):
         response = self.get('chapters')
-        index_soup = BeautifulSoup(response, 'html.parser')
-
-        tabs = index_soup.find('ul', class_='pagination')
-        tab_numbers = [span.text for span in tabs.find_all('li') if span.text.isalnum()]
-
-        chapters = []
-        for page_num in tab_numbers:
-            response = self.get(f'chapters?page={page_num}')
-            index_soup = BeautifulSoup(response, 'html.parser')
-            ul_soup = index_soup.find('ul', class_='chapter-list')
-            if ul_soup:
-                chapters += [chapter_link['href'] for chapter_link in ul_soup.find_all('a', href=True)]
+        first_page_chapters, page_numbers = self._parse_index_page(response)
+
+        # The pagination may skip pages in the middle, so trust only the last page number
+        page_count = max(page_numbers, default=1)
+        page_urls = [f'chapters?page={page_num}' for page_num in range(2, page_count + 1)]
+
+        if known_chapters:
+            known = set(known_chapters)
+
+            # New chapters are only ever added at the end, so walk back from the newest page until
+            # reaching one which has chapters we already know about
+            new_chapters = []
+            for page_url in reversed(page_urls):
+                page_chapters, _ = self._parse_index_page(self.get(page_url))
+                if known.intersection(page_chapters):
+                    new_chapters = [url for url in page_chapters if url not in known] + new_chapters
+                    self.log.debug(f"Found {len(new_chapters)} new chapters")
+                    return list(known_chapters) + new_chapters
+                new_chapters = page_chapters + new_chapters
+
+            if known.intersection(first_page_chapters):
+                new_chapters = [url for url in first_page_chapters if url not in known] + new_chapters
+                self.log.debug(f"Found {len(new_chapters)} new chapters")
+                return list(known_chapters) + new_chapters
+
+            self.log.warning("None of the known chapters are listed anymore, discovering all chapters")
+            chapters = first_page_chapters + new_chapters
+        else:
+            pages = [[] for _ in page_urls]
+            for position, response in self.fetch_all(page_urls):
+                pages[position], _ = self._parse_index_page(response)
+            chapters = first_page_chapters + [url for page_chapters in pages for url in page_chapters]
 
         if not chapters:
             raise RuntimeError("No chapter-list <ul> found.")
         return chapters
 
-    def parse_chapter(self, chapter_html: str, fname: str) -> str:
+    @classmethod
+    def parse_chapter(cls, chapter_html: str) -> tuple[str, str]:
+        if lxml_html is None:
+            return cls._parse_chapter_soup(chapter_html)
+        return cls._parse_chapter_lxml(chapter_html)
+
+    @staticmethod
+    def _parse_chapter_soup(chapter_html: str) -> tuple[str, str]:
         index_soup = BeautifulSoup(chapter_html, 'html.parser')
 
         chapter_title = index_soup.find('span', class_='chapter-title').text
         page_text = '\n'.join([str(p).removeprefix('<p>').removesuffix('</p>')
                                for p in index_soup.find('div', id='chapter-container').find_all('p')])
 
-        with open(self.novel_dir / 'raw_chapters' / fname, 'w') as chapter_file:
-            chapter_file.write(page_text)
+        return chapter_title, page_text
+
+    @staticmethod
+    def _parse_chapter_lxml(chapter_html: str) -> tuple[str, str]:
+        """ Same output as _parse_chapter_soup, but only the title and chapter container are visited """
+        root = lxml_html.fromstring(chapter_html)
+
+        title_nodes = root.xpath(CHAPTER_TITLE_XPATH)
+        container_nodes = root.xpath(CHAPTER_CONTAINER_XPATH)
+        if not title_nodes or not container_nodes:
+            raise RuntimeError("No chapter-title or chapter-container found.")
+
+        paragraphs = []
+        for p in container_nodes[0].iter('p'):
+            # Serialise as XML to match BeautifulSoup's output, e.g. <br/> rather than <br>
+            p_str = etree.tostring(p, method='xml', encoding='unicode', with_tail=False)
+            paragraphs.append('' if p_str == '<p/>' else p_str.removeprefix('<p>').removesuffix('</p>'))
 
-        return chapter_title
+        return title_nodes[0].text_content(), '\n'.join(paragraphs)
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+
+ManifestEntry = dict[str, int | float | str | None]
+
+
+class ChapterManifest:
+    """ A per-novel record of every chapter page download
+
+    # A single manifest entry
+    {
+        "url": "https://...",
+        "name_index": 12,
+        "status": "ok",                # "ok" or "failed"
+        "fetch_ts": 1234567890.0,      # Time of the last successful fetch or revalidation
+        "size": 12345,                 # Bytes on disk
+        "sha256": "abc...",
+        "etag": "\"xyz\"",             # Validators for conditional requests, if the site sent any
+        "last_modified": "Wed, 21 Oct 2015 07:28:00 GMT",
+        "error": null
+    }
+
+    Entries are appended to the manifest as each chapter finishes so a crashed scrape loses nothing. The
+    latest line for a URL wins when loading, and compact() rewrites the file with one line per URL.
+    """
+    FILENAME = 'manifest.jsonl'
+
+    def __init__(self, novel_dir: Path):
+        self.log = logging.getLogger(self.__class__.__name__)
+
+        self.manifest_fp = novel_dir / self.FILENAME
+        self.entries: dict[str, ManifestEntry] = {}
+        self._lock = threading.Lock()  # Downloads and parsing may record entries from different threads
+
+        if self.manifest_fp.exists():
+            with open(self.manifest_fp, 'r') as manifest_file:
+                for line in manifest_file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Most likely a line cut short by a crash
+                        self.log.warning(f"Skipping unreadable manifest line: {line!r}")
+                        continue
+                    self.entries[entry['url']] = entry
+
+    def get(self, url) -> ManifestEntry | None:
+        return self.entries.get(url)
+
+    def _append(self, entry: ManifestEntry):
+        with self._lock:
+            self.entries[entry['url']] = entry
+            with open(self.manifest_fp, 'a') as manifest_file:
+                manifest_file.write(json.dumps(entry) + '\n')
+
+    def record_success(self, url, name_index, text, size, headers):
+        self._append({
+            'url': url,
+            'name_index': name_index,
+            'status': 'ok',
+            'fetch_ts': time.time(),
+            'size': size,
+            'sha256': hashlib.sha256(text.encode('utf-8')).hexdigest(),
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'error': None,
+        })
+
+    def record_unchanged(self, url):
+        self._append(self.entries[url] | {'fetch_ts': time.time()})
+
+    def record_failure(self, url, name_index, error):
+        # Keep the validators of a previous good copy, the status alone marks it for fetching again
+        self._append((self.entries.get(url) or {}) | {
+            'url': url,
+            'name_index': name_index,
+            'status': 'failed',
+            'error': str(error),
+        })
+
+    def compact(self):
+        with self._lock:
+            tmp_fp = self.manifest_fp.with_suffix('.tmp')
+            with open(tmp_fp, 'w') as manifest_file:
+                for entry in self.entries.values():
+                    manifest_file.write(json.dumps(entry) + '\n')
+            tmp_fp.replace(self.manifest_fp)
@@ -0,0 +1,140 @@
+import logging
+import random
+import threading
+import time
+
+import requests
+from selenium.common.exceptions import WebDriverException
+
+
+class FetchError(RuntimeError):
+    def __init__(self, url, status, retry_after=None):
+        super().__init__(f"Request for '{url}' failed with status {status}")
+        self.url = url
+        self.status = status
+        self.retry_after = retry_after  # Seconds the site asked us to wait, if it said
+
+
+def parse_retry_after(value) -> float | None:
+    # Retry-After may also be an HTTP date, which isn't worth the trouble of parsing
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class HostThrottle:
+    """ Adaptive rate and concurrency limits for requests to one host
+
+    Requests take a token from a bucket refilled at `rate` tokens per second, and at most `concurrency`
+    requests may be in flight. Both grow additively while responses are fast and are cut multiplicatively
+    when the host throttles us (429/503), fails or slows down, so they settle near the highest load the host
+    tolerates.
+    """
+    THROTTLE_STATUSES = {429, 503}
+    RATE_STEP = 0.1         # Requests per second added after each fast response
+    BACKOFF_FACTOR = 0.5    # Multiplier applied to the rate and concurrency when throttled
+    SLOW_FACTOR = 0.8       # Multiplier applied to the rate after a slow response
+
+    def __init__(self, host, rate=2.0, max_rate=20.0, min_rate=0.1, max_concurrency=4, slow_response=10.0):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.host = host
+
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.concurrency = 1
+        self.max_concurrency = max_concurrency
+        self.slow_response = slow_response
+
+        self._tokens = 1.0
+        self._last_refill = time.monotonic()
+        self._in_flight = 0
+        self._fast_streak = 0
+        self._blocked_until = 0.0
+        self._condition = threading.Condition()
+
+    def _refill(self, now):
+        self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        """ Block until a request may be sent """
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self._in_flight < self.concurrency and self._tokens >= 1 and now >= self._blocked_until:
+                    self._tokens -= 1
+                    self._in_flight += 1
+                    return
+
+                wait = max(self._blocked_until - now, (1 - self._tokens) / self.rate, 0.01)
+                self._condition.wait(timeout=wait)
+
+    def release(self, elapsed: float = None, status: int = None, retry_after: float = None):
+        """ Report the outcome of a request started with acquire()
+
+        Args:
+            elapsed: how long the request took, or None if it failed without a response
+            status: the response status, if there was a response
+            retry_after: seconds the host asked us to wait before the next request
+        """
+        with self._condition:
+            self._in_flight -= 1
+
+            if elapsed is None or status in self.THROTTLE_STATUSES:
+                self.rate = max(self.min_rate, self.rate * self.BACKOFF_FACTOR)
+                self.concurrency = max(1, int(self.concurrency * self.BACKOFF_FACTOR))
+                self._fast_streak = 0
+                if retry_after:
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+                self.log.info(f"Backing off {self.host} to {self.rate:.2f} req/s, {self.concurrency} at once")
+            elif elapsed > self.slow_response:
+                self.rate = max(self.min_rate, self.rate * self.SLOW_FACTOR)
+                self._fast_streak = 0
+                self.log.debug(f"Slow response from {self.host}, slowing to {self.rate:.2f} req/s")
+            else:
+                self.rate = min(self.max_rate, self.rate + self.RATE_STEP)
+                self._fast_streak += 1
+                if self._fast_streak >= self.concurrency and self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+                    self._fast_streak = 0
+
+            self._condition.notify_all()
+
+
+_throttles: dict[str, HostThrottle] = {}
+_throttles_lock = threading.Lock()
+
+
+def get_host_throttle(host, **kwargs) -> HostThrottle:
+    """ Get the throttle shared by every scraper sending requests to a host """
+    with _throttles_lock:
+        if host not in _throttles:
+            _throttles[host] = HostThrottle(host, **kwargs)
+        return _throttles[host]
+
+
+class RetryPolicy:
+    """ Which failed requests to try again and how long to wait first """
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, max_attempts=5, base_delay=1.0, max_delay=120.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, exc: Exception, attempt: int) -> bool:
+        if attempt + 1 >= self.max_attempts:
+            return False
+        if isinstance(exc, FetchError):
+            return exc.status in self.RETRY_STATUSES
+        return isinstance(exc, (requests.RequestException, WebDriverException))
+
+    def delay(self, exc: Exception, attempt: int) -> float:
+        """ Exponential backoff with jitter, so retries from several workers don't arrive together """
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+        if isinstance(exc, FetchError) and exc.retry_after:
+            delay = max(delay, exc.retry_after)
+        return delay
@@ -0,0 +1,118 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from webnovels.catalog import get_chapter_catalog
+from webnovels.editing import ChangeRecord, EditTracker, NovelSpellChecker
+from webnovels.storage import get_chapter_store
+from webnovels.utils import bounded_map, get_chapter_info, get_novel_dir, get_novel_titles
+
+SAVE_EVERY = 200  # Chapters checked between writes to the error index
+
+
+def error_index_key(raw_text: str, history: list[ChangeRecord], dictionary_version: str) -> str:
+    """ Identify the content a chapter's potential errors were found for """
+    digest = hashlib.sha256()
+    digest.update(raw_text.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(json.dumps(history, sort_keys=True).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(dictionary_version.encode('utf-8'))
+    return digest.hexdigest()
+
+
+_worker_spell_checker: NovelSpellChecker = None
+
+
+def _init_worker(novel_title):
+    global _worker_spell_checker
+    _worker_spell_checker = NovelSpellChecker(suggestions=False)
+    _worker_spell_checker.load_novel(novel_title)
+
+
+def _check_text(text):
+    return _worker_spell_checker.get_potential_errors(text)
+
+
+def check_novel(novel_title: str, workers: int = None, force: bool = False) -> int:
+    """ Find the potential errors of every chapter which has changed since it was last checked
+
+    Chapters are checked in a process pool and the results stored in the novel's chapter catalog, keyed by
+    error_index_key() so that a change to the text, the change list or the dictionary invalidates them.
+
+    Returns:
+        The number of chapters checked
+    """
+    log = logging.getLogger('check_novel')
+    workers = workers or os.cpu_count()
+
+    spell_checker = NovelSpellChecker(suggestions=False)
+    spell_checker.load_novel(novel_title)
+    dictionary_version = spell_checker.dictionary_version
+
+    novel_dir = get_novel_dir(novel_title)
+    catalog = get_chapter_catalog(novel_dir)
+    store = get_chapter_store(novel_dir)
+    stored_keys = {} if force else catalog.error_keys()
+
+    stale = []  # (name_index, content_key) in the order their texts are checked
+    edit_tracker = EditTracker()
+
+    def stale_texts():
+        for chapter_info in get_chapter_info(novel_title):
+            name_index = chapter_info['name_index']
+            if not store.exists('raw_chapters', name_index):
+                log.debug(f"Chapter {name_index} hasn't been parsed, skipping")
+                continue
+
+            edit_tracker.load_chapter_index(novel_title, name_index)
+            content_key = error_index_key(edit_tracker.raw_text, edit_tracker.history, dictionary_version)
+            if stored_keys.get(name_index) != content_key:
+                stale.append((name_index, content_key))
+                yield edit_tracker.processed_text
+
+    if workers <= 1:
+        results = enumerate(map(spell_checker.get_potential_errors, stale_texts()))
+        checked = _save_errors(catalog, stale, results)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(novel_title,)) as executor:
+            results = bounded_map(executor, _check_text, stale_texts(), max_pending=2 * workers)
+            checked = _save_errors(catalog, stale, results)
+
+    log.info(f"Checked {checked} chapters of '{novel_title}'")
+    return checked
+
+
+def _save_errors(catalog, stale, results) -> int:
+    checked = 0
+    batch = {}
+    for position, chapter_errors in results:
+        name_index, content_key = stale[position]
+        batch[name_index] = content_key, chapter_errors
+        checked += 1
+        if len(batch) >= SAVE_EVERY:
+            catalog.set_errors(batch)
+            batch = {}
+    catalog.set_errors(batch)
+    return checked
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Find the potential spelling errors in every chapter of a novel")
+    parser.add_argument('titles', nargs='*', help="Novels to check, defaults to every novel")
+    parser.add_argument('--workers', type=int, default=None, help="Processes to check chapters with")
+    parser.add_argument('--force', action='store_true', help="Check chapters even if they haven't changed")
+    parser.add_argument('--top', type=int, default=10, help="How many of the worst chapters to list")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    for title in args.titles or get_novel_titles():
+        check_novel(title, workers=args.workers, force=args.force)
+
+        print(f"Chapters of '{title}' with the most potential errors:")
+        for chapter_info, error_count in get_chapter_catalog(get_novel_dir(title)).most_errors(args.top):
+            print(f"  {error_count:5}  {chapter_info['chapter_title']}")
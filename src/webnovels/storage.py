@@ -0,0 +1,359 @@
+import argparse
+import json
+import logging
+import mmap
+import shutil
+import threading
+import zlib
+from pathlib import Path
+
+
+class ChapterStore:
+    """ Reads and writes the per-chapter documents of a novel
+
+    Every chapter has up to one document of each kind, addressed by the chapter's name_index.
+    """
+    KINDS = {
+        'raw_html': '.html',
+        'raw_chapters': '.txt',
+        'change_lists': '.json',
+        'change_journals': '.jsonl',
+    }
+
+    def __init__(self, novel_dir: Path):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.novel_dir = novel_dir
+
+    def read(self, kind: str, chapter_idx: int) -> str:
+        """ Raises FileNotFoundError if the document doesn't exist """
+        raise NotImplementedError
+
+    def write(self, kind: str, chapter_idx: int, text: str) -> int:
+        """ Store a document, replacing any previous version, and return its size in bytes """
+        raise NotImplementedError
+
+    def append(self, kind: str, chapter_idx: int, text: str) -> int:
+        """ Add text to the end of a document, creating it if needed, and return its new size in bytes """
+        raise NotImplementedError
+
+    def size(self, kind: str, chapter_idx: int) -> int | None:
+        """ The UTF-8 length of a document in bytes, or None if it doesn't exist """
+        raise NotImplementedError
+
+    def exists(self, kind: str, chapter_idx: int) -> bool:
+        return self.size(kind, chapter_idx) is not None
+
+    def chapter_indices(self, kind: str) -> list[int]:
+        raise NotImplementedError
+
+    def maybe_compact(self) -> bool:
+        """ Reclaim the space left by replaced documents if there's enough of it, returning whether it did """
+        return False
+
+    def close(self):
+        pass
+
+
+class DirectoryStore(ChapterStore):
+    """ The original layout of one file per document, e.g. raw_html/12.html
+
+    Documents are written as UTF-8 without newline translation, so a file's size is the same on every platform
+    and matches the size a PackedStore gives the same text.
+    """
+
+    def _fp(self, kind, chapter_idx):
+        return self.novel_dir / kind / f'{chapter_idx}{self.KINDS[kind]}'
+
+    def read(self, kind, chapter_idx):
+        fp = self._fp(kind, chapter_idx)
+        try:
+            with open(fp, 'r', encoding='utf-8') as chapter_file:
+                return chapter_file.read()
+        except UnicodeDecodeError:
+            # Written before documents were always UTF-8, in the locale's encoding
+            self.log.warning(f"Reading {fp} in the locale encoding")
+            with open(fp, 'r') as chapter_file:
+                return chapter_file.read()
+
+    def write(self, kind, chapter_idx, text):
+        fp = self._fp(kind, chapter_idx)
+        fp.parent.mkdir(exist_ok=True)
+        with open(fp, 'w', encoding='utf-8', newline='') as chapter_file:
+            chapter_file.write(text)
+        return fp.stat().st_size
+
+    def append(self, kind, chapter_idx, text):
+        fp = self._fp(kind, chapter_idx)
+        fp.parent.mkdir(exist_ok=True)
+        with open(fp, 'a', encoding='utf-8', newline='') as chapter_file:
+            chapter_file.write(text)
+        return fp.stat().st_size
+
+    def size(self, kind, chapter_idx):
+        try:
+            return self._fp(kind, chapter_idx).stat().st_size
+        except FileNotFoundError:
+            return None
+
+    def chapter_indices(self, kind):
+        return sorted(int(fp.stem) for fp in (self.novel_dir / kind).glob(f'*{self.KINDS[kind]}'))
+
+
+class PackedStore(ChapterStore):
+    """ All documents of a novel in one append-only pack file
+
+    Documents are zlib compressed and appended to the pack, then their location is appended to a JSON
+    lines index. Loading replays the index so the last write of a document wins. Reads go through a
+    memory map of the pack, which is remapped whenever it has grown past the mapped size.
+
+    Appending to a document stores the new text as another segment, marked in the index as belonging after
+    the previous ones. Replaced documents leave dead space in the pack, and appended documents stay in
+    segments, until compact() is called. maybe_compact() does so once the dead space is a large enough part
+    of the pack. Neither is ever called implicitly: another process with the novel open, e.g. the GUI while a
+    scraper runs, would keep reading the old offsets, so packs are only compacted from the command line.
+    """
+    PACK_FILENAME = 'chapters.pack'
+    INDEX_FILENAME = 'chapters.idx'
+    COMPACT_DEAD_FRACTION = 0.5  # Part of the pack which must be dead space before maybe_compact() compacts
+    COMPACT_MIN_DEAD_BYTES = 1024 ** 2
+
+    def __init__(self, novel_dir):
+        super().__init__(novel_dir)
+        self.pack_fp = novel_dir / self.PACK_FILENAME
+        self.index_fp = novel_dir / self.INDEX_FILENAME
+        self.pack_fp.touch()
+        self.index_fp.touch()
+
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._index: dict[tuple[str, int], list[tuple[int, int, int]]] = {}  # -> [(offset, length, size)]
+
+        pack_size = self.pack_fp.stat().st_size
+        with open(self.index_fp, 'r') as index_file:
+            for line in index_file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    self.log.warning(f"Skipping unreadable index line: {line!r}")
+                    continue
+                if entry['offset'] + entry['length'] > pack_size:
+                    # The blob write didn't complete before a crash
+                    self.log.warning(f"Skipping truncated document {entry['kind']}/{entry['chapter_idx']}")
+                    continue
+                key = entry['kind'], entry['chapter_idx']
+                segment = entry['offset'], entry['length'], entry['size']
+                if entry.get('append') and key in self._index:
+                    self._index[key].append(segment)
+                else:
+                    self._index[key] = [segment]
+
+        # Bytes of the pack holding the latest version of a document, the rest is dead space
+        self._live_bytes = sum(length for segments in self._index.values() for _, length, _ in segments)
+
+    def _view(self, end):
+        if end == 0:
+            return b''
+        if self._mmap is None or len(self._mmap) < end:
+            if self._mmap is not None:
+                self._mmap.close()
+            with open(self.pack_fp, 'rb') as pack_file:
+                self._mmap = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def read(self, kind, chapter_idx):
+        with self._lock:
+            if (kind, chapter_idx) not in self._index:
+                raise FileNotFoundError(f"No {kind} document for chapter {chapter_idx} in {self.pack_fp}")
+            segments = self._index[kind, chapter_idx]
+            view = self._view(max(offset + length for offset, length, _ in segments))
+            blobs = [view[offset:offset + length] for offset, length, _ in segments]
+        return b''.join(zlib.decompress(blob) for blob in blobs).decode('utf-8')
+
+    def _add_segment(self, kind, chapter_idx, text, append):
+        data = text.encode('utf-8')
+        blob = zlib.compress(data)
+
+        with self._lock:
+            append = append and (kind, chapter_idx) in self._index
+            with open(self.pack_fp, 'ab') as pack_file:
+                offset = pack_file.tell()
+                pack_file.write(blob)
+            entry = {
+                'kind': kind,
+                'chapter_idx': chapter_idx,
+                'offset': offset,
+                'length': len(blob),
+                'size': len(data),
+            }
+            if append:
+                entry['append'] = True
+            with open(self.index_fp, 'a') as index_file:
+                index_file.write(json.dumps(entry) + '\n')
+
+            segment = offset, len(blob), len(data)
+            if append:
+                self._index[kind, chapter_idx].append(segment)
+            else:
+                self._live_bytes -= sum(length for _, length, _ in self._index.get((kind, chapter_idx), []))
+                self._index[kind, chapter_idx] = [segment]
+            self._live_bytes += len(blob)
+            return sum(size for _, _, size in self._index[kind, chapter_idx])
+
+    def write(self, kind, chapter_idx, text):
+        return self._add_segment(kind, chapter_idx, text, append=False)
+
+    def append(self, kind, chapter_idx, text):
+        return self._add_segment(kind, chapter_idx, text, append=True)
+
+    def size(self, kind, chapter_idx):
+        if (kind, chapter_idx) in self._index:
+            return sum(size for _, _, size in self._index[kind, chapter_idx])
+        return None
+
+    def chapter_indices(self, kind):
+        return sorted(idx for doc_kind, idx in self._index if doc_kind == kind)
+
+    def compact(self):
+        """ Rewrite the pack with only the latest version of each document, joining appended segments """
+        with self._lock:
+            tmp_pack_fp = self.pack_fp.with_suffix('.pack.tmp')
+            tmp_index_fp = self.index_fp.with_suffix('.idx.tmp')
+
+            view = self._view(self.pack_fp.stat().st_size)
+            new_index = {}
+            with open(tmp_pack_fp, 'wb') as pack_file, open(tmp_index_fp, 'w') as index_file:
+                for (kind, chapter_idx), segments in sorted(self._index.items()):
+                    if len(segments) == 1:
+                        offset, length, size = segments[0]
+                        blob = view[offset:offset + length]
+                    else:
+                        data = b''.join(zlib.decompress(view[offset:offset + length])
+                                        for offset, length, _ in segments)
+                        blob = zlib.compress(data)
+                        length, size = len(blob), len(data)
+
+                    new_offset = pack_file.tell()
+                    pack_file.write(blob)
+                    index_file.write(json.dumps({
+                        'kind': kind,
+                        'chapter_idx': chapter_idx,
+                        'offset': new_offset,
+                        'length': length,
+                        'size': size,
+                    }) + '\n')
+                    new_index[kind, chapter_idx] = [(new_offset, length, size)]
+
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            tmp_pack_fp.replace(self.pack_fp)
+            tmp_index_fp.replace(self.index_fp)
+            self._index = new_index
+            self._live_bytes = self.pack_fp.stat().st_size
+
+    @property
+    def dead_bytes(self) -> int:
+        with self._lock:
+            return self.pack_fp.stat().st_size - self._live_bytes
+
+    def maybe_compact(self):
+        dead_bytes = self.dead_bytes
+        if dead_bytes < self.COMPACT_MIN_DEAD_BYTES:
+            return False
+        if dead_bytes < self.COMPACT_DEAD_FRACTION * self.pack_fp.stat().st_size:
+            return False
+
+        self.log.info(f"Compacting {self.pack_fp}, {dead_bytes} bytes are dead")
+        self.compact()
+        return True
+
+    def close(self):
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+
+
+_stores: dict[Path, ChapterStore] = {}
+_stores_lock = threading.Lock()
+
+
+def is_packed(novel_dir: Path):
+    return (novel_dir / PackedStore.PACK_FILENAME).exists()
+
+
+def get_chapter_store(novel_dir: Path) -> ChapterStore:
+    """ Get the shared store for a novel, so every reader sees the same index """
+    with _stores_lock:
+        if novel_dir not in _stores:
+            _stores[novel_dir] = PackedStore(novel_dir) if is_packed(novel_dir) else DirectoryStore(novel_dir)
+        return _stores[novel_dir]
+
+
+def migrate_to_packed(novel_dir: Path):
+    """ Move every chapter document of a novel from separate files into a pack
+
+    The pack is built and verified in a temporary directory and only moved into place once complete, so an
+    interrupted migration leaves the original files untouched.
+    """
+    log = logging.getLogger('migrate_to_packed')
+    if is_packed(novel_dir):
+        raise RuntimeError(f"'{novel_dir}' is already packed")
+
+    source = DirectoryStore(novel_dir)
+    tmp_dir = novel_dir / '.pack_migration'
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir()
+
+    target = PackedStore(tmp_dir)
+    count = 0
+    for kind in ChapterStore.KINDS:
+        for chapter_idx in source.chapter_indices(kind):
+            text = source.read(kind, chapter_idx)
+            target.write(kind, chapter_idx, text)
+            if target.read(kind, chapter_idx) != text:
+                raise RuntimeError(f"Verification failed for {kind}/{chapter_idx} in '{novel_dir}'")
+            count += 1
+    target.close()
+
+    with _stores_lock:
+        _stores.pop(novel_dir, None)
+        (tmp_dir / PackedStore.INDEX_FILENAME).replace(novel_dir / PackedStore.INDEX_FILENAME)
+        (tmp_dir / PackedStore.PACK_FILENAME).replace(novel_dir / PackedStore.PACK_FILENAME)
+    tmp_dir.rmdir()
+
+    for kind in ChapterStore.KINDS:
+        if (novel_dir / kind).exists():
+            shutil.rmtree(novel_dir / kind)
+
+    log.info(f"Packed {count} documents for '{novel_dir.name}'")
+
+
+if __name__ == '__main__':
+    from webnovels.utils import NOVELS_DIR, get_novel_dir
+
+    parser = argparse.ArgumentParser(description="Convert novel directories to the packed chapter format")
+    parser.add_argument('titles', nargs='*', help="Novels to convert, defaults to every unpacked novel")
+    parser.add_argument('--compact', action='store_true',
+                        help="Compact the packs of novels which are already packed instead, defaults to every one. "
+                             "Nothing else may have the novels open meanwhile")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.titles:
+        novel_dirs = [get_novel_dir(title) for title in args.titles]
+    else:
+        novel_dirs = [fp.parent for fp in NOVELS_DIR.glob('*/metadata.json')
+                      if is_packed(fp.parent) == args.compact]
+
+    for novel_dir in novel_dirs:
+        if args.compact:
+            store = get_chapter_store(novel_dir)
+            if not isinstance(store, PackedStore):
+                raise RuntimeError(f"'{novel_dir}' isn't packed")
+            size = store.pack_fp.stat().st_size
+            store.compact()
+            logging.info(f"Compacted '{novel_dir.name}' from {size} to {store.pack_fp.stat().st_size} bytes")
+        else:
+            migrate_to_packed(novel_dir)
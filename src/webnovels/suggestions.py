@@ -0,0 +1,136 @@
+import bisect
+import zlib
+from array import array
+from collections import defaultdict
+from typing import Iterable
+
+MAX_DISTANCE = 2
+PREFIX_LENGTH = 7  # Only deletions from the start of a word are indexed, which bounds the index size
+INDEX_VERSION = 2  # Part of the names of cached indexes, bump it when deletes() changes
+
+
+def deletes(word: str, max_distance: int = MAX_DISTANCE, prefix_length: int = PREFIX_LENGTH) -> dict[str, int]:
+    """ Every string left after deleting up to max_distance characters from the prefix of a word, mapped to
+    how many characters were deleted
+
+    Words no longer than max_distance delete all the way down to the empty string, which is how they match
+    other short words they share no characters with, e.g. 'a' and 'I'.
+    """
+    word = word[:prefix_length]
+    found = {word: 0}
+    frontier = {word}
+    for depth in range(1, max_distance + 1):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        for delete in frontier:
+            found.setdefault(delete, depth)
+    return found
+
+
+def edit_distance(a: str, b: str, max_distance: int = MAX_DISTANCE) -> int:
+    """ The optimal string alignment distance between two strings, or max_distance + 1 if it's any greater
+
+    Like Levenshtein distance, but swapping two adjacent characters also counts as one edit.
+    """
+    too_far = max_distance + 1
+    if abs(len(a) - len(b)) > max_distance:
+        return too_far
+    # Each edit adds or removes at most one character from each string's set of characters
+    if len(set(a) ^ set(b)) > 2 * max_distance:
+        return too_far
+
+    # Common prefixes and suffixes don't change the distance
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    a, b = a[start:], b[start:]
+    while a and b and a[-1] == b[-1]:
+        a, b = a[:-1], b[:-1]
+    if not a or not b:
+        return min(len(a) + len(b), too_far)
+
+    # Only cells within max_distance of the diagonal can be in range, the rest are left as too_far
+    previous_previous = None
+    previous = [j if j <= max_distance else too_far for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [too_far] * (len(b) + 1)
+        if i <= max_distance:
+            current[0] = i
+        for j in range(max(1, i - max_distance), min(len(b), i + max_distance) + 1):
+            cost = a[i - 1] != b[j - 1]
+            distance = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                distance = min(distance, previous_previous[j - 2] + 1)
+            current[j] = distance
+        if min(current) > max_distance:
+            return too_far
+        previous_previous, previous = previous, current
+
+    return min(previous[-1], too_far)
+
+
+def _delete_key(delete: str) -> int:
+    return zlib.crc32(delete.encode('utf-8'))
+
+
+class DeletionIndex:
+    """ Maps the deletes of each word back to the words, so near misses can be found by looking up their deletes
+
+    Two words within n edits of each other always share a delete made by removing at most n characters from
+    each, so looking up the deletes of a misspelling finds every candidate correction without generating the
+    far larger set of possible edits.
+    """
+
+    def __init__(self, words: Iterable[str] = ()):
+        self._words: dict[str, dict[str, int]] = defaultdict(dict)
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str):
+        for delete, depth in deletes(word).items():
+            self._words[delete][word] = depth
+
+    def lookup(self, word: str, max_distance: int = MAX_DISTANCE) -> set[str]:
+        """ Words which may be within max_distance edits of word, which still need their distance checking """
+        found = set()
+        for delete, depth in deletes(word, max_distance).items():
+            found.update(match for match, match_depth in self._words.get(delete, {}).items()
+                         if match_depth <= max_distance)
+        return found
+
+
+class CompiledDeletionIndex:
+    """ A read-only DeletionIndex for a large word list, packed into one sorted array
+
+    Each entry is the CRC32 of a delete in the upper 32 bits, then how many characters were deleted in 2 bits
+    and the position of its word in the word list in the remaining 30. The words for a delete are a contiguous
+    run found by bisecting. Hash collisions only add candidates, which the distance check removes.
+    """
+    WORD_BITS = 30
+
+    def __init__(self, words: list[str], entries: array):
+        self.words = words
+        self.entries = entries
+
+    @classmethod
+    def build(cls, words: Iterable[str]) -> 'CompiledDeletionIndex':
+        words = list(words)
+        if len(words) >= 1 << cls.WORD_BITS:
+            raise RuntimeError(f"Too many words to index: {len(words)}")
+
+        entries = []
+        for word_id, word in enumerate(words):
+            entries.extend(_delete_key(delete) << 32 | depth << cls.WORD_BITS | word_id
+                           for delete, depth in deletes(word).items())
+        entries.sort()
+        return cls(words, array('Q', entries))
+
+    def lookup(self, word: str, max_distance: int = MAX_DISTANCE) -> set[str]:
+        word_mask = (1 << self.WORD_BITS) - 1
+        found = set()
+        for delete in deletes(word, max_distance):
+            key = _delete_key(delete)
+            # Entries with the same key are sorted by depth, so stop at the first one deleting too much
+            i = bisect.bisect_left(self.entries, key << 32)
+            end = bisect.bisect_left(self.entries, key << 32 | (max_distance + 1) << self.WORD_BITS, lo=i)
+            found.update(self.words[entry & word_mask] for entry in self.entries[i:end])
+        return found
@@ -0,0 +1,182 @@
+import argparse
+import random
+import time
+
+
+class _Piece:
+    """ A node of the piece tree, holding source[start:end] and the total length of its subtree """
+    __slots__ = ('source', 'start', 'end', 'priority', 'left', 'right', 'length')
+
+    def __init__(self, source: str, start: int, end: int):
+        self.source = source
+        self.start = start
+        self.end = end
+        self.priority = random.random()
+        self.left: _Piece | None = None
+        self.right: _Piece | None = None
+        self.length = end - start
+
+
+def _length(node):
+    return node.length if node is not None else 0
+
+
+def _update(node):
+    node.length = _length(node.left) + node.end - node.start + _length(node.right)
+
+
+def _split(node, pos):
+    """ Split a tree into the pieces before and after pos, cutting a piece in two if pos falls inside it """
+    if node is None:
+        return None, None
+
+    left_length = _length(node.left)
+    piece_length = node.end - node.start
+    if pos <= left_length:
+        before, after = _split(node.left, pos)
+        node.left = after
+        _update(node)
+        return before, node
+    if pos >= left_length + piece_length:
+        before, after = _split(node.right, pos - left_length - piece_length)
+        node.right = before
+        _update(node)
+        return node, after
+
+    # Cut the piece, the part after pos gets its own priority so it's merged back into the tree like a new piece
+    cut = node.start + pos - left_length
+    after = _Piece(node.source, cut, node.end)
+    right = node.right
+    node.end = cut
+    node.right = None
+    _update(node)
+    return node, _merge(after, right)
+
+
+def _merge(left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+class PieceTable:
+    """ An editable text which never copies the whole text to make an edit
+
+    The text is a sequence of pieces, each a slice of either the original text or a string that was inserted.
+    The pieces are kept in a randomised balanced tree (a treap) ordered by position, with subtree lengths in
+    each node, so finding, splitting and joining pieces at an index takes O(log pieces). The full string is
+    only built when asked for, and is kept until the next edit.
+    """
+
+    def __init__(self, text: str = ''):
+        self._root = _Piece(text, 0, len(text)) if text else None
+        self._text = text
+
+    def __len__(self):
+        return _length(self._root)
+
+    def __str__(self):
+        if self._text is None:
+            self._text = ''.join(self._slices(self._root, 0, len(self)))
+        return self._text
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                return str(self)[key]
+            if self._text is not None:
+                return self._text[start:stop]
+            return ''.join(self._slices(self._root, start, stop)) if start < stop else ''
+
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("PieceTable index out of range")
+        if self._text is not None:
+            return self._text[key]
+
+        node = self._root
+        while True:
+            left_length = _length(node.left)
+            if key < left_length:
+                node = node.left
+                continue
+            key -= left_length
+            if key < node.end - node.start:
+                return node.source[node.start + key]
+            key -= node.end - node.start
+            node = node.right
+
+    def __eq__(self, other):
+        if isinstance(other, PieceTable):
+            other = str(other)
+        return str(self) == other
+
+    def _slices(self, node, start, stop):
+        """ Yield the parts of the pieces under node that fall within [start, stop) in order """
+        stack = []
+        offset = 0  # Position of the leftmost character under node
+        while stack or node is not None:
+            if node is not None:
+                stack.append((node, offset))
+                # Skip the left subtree if it ends before start
+                node = node.left if offset + _length(node.left) > start else None
+                continue
+
+            node, offset = stack.pop()
+            piece_start = offset + _length(node.left)
+            piece_end = piece_start + node.end - node.start
+            if piece_start >= stop:
+                return
+            if piece_end > start:
+                cut_start = node.start + max(start - piece_start, 0)
+                cut_end = node.start + min(stop, piece_end) - piece_start
+                yield node.source[cut_start:cut_end]
+            node, offset = node.right, piece_end
+
+    def replace(self, start: int, end: int, text: str):
+        """ Replace the text between start and end """
+        before, rest = _split(self._root, start)
+        _, after = _split(rest, end - start)
+        if text:
+            before = _merge(before, _Piece(text, 0, len(text)))
+        self._root = _merge(before, after)
+        self._text = None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the cost of an edit to a PieceTable and to a str")
+    parser.add_argument('--edits', type=int, default=2000, help="Edits to time for each text size")
+    args = parser.parse_args()
+
+    words = "the quick brown fox jumps over the lazy dog".split()
+    print(f"{'words':>8}  {'str µs/edit':>12}  {'PieceTable µs/edit':>18}")
+    for word_count in (10_000, 50_000, 200_000):
+        text = ' '.join(random.choice(words) for _ in range(word_count))
+        edits = [(random.randrange(len(text)), random.choice(['', 'a', 'xyz'])) for _ in range(args.edits)]
+
+        # The same edits as EditTracker used to make, slicing and joining the whole string every time
+        plain = text
+        start_time = time.perf_counter()
+        for position, new_text in edits:
+            plain = plain[:position] + new_text + plain[position + 1:]
+        str_cost = (time.perf_counter() - start_time) / args.edits
+
+        buffer = PieceTable(text)
+        start_time = time.perf_counter()
+        for position, new_text in edits:
+            buffer.replace(position, position + 1, new_text)
+        buffer_cost = (time.perf_counter() - start_time) / args.edits
+
+        if str(buffer) != plain:
+            raise RuntimeError("PieceTable and str disagree")
+        print(f"{word_count:8}  {str_cost * 1e6:12.1f}  {buffer_cost * 1e6:18.1f}")
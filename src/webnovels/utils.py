@@ -1,7 +1,16 @@
+import bisect
 import json
+import queue
+import threading
+from concurrent.futures import Executor, FIRST_COMPLETED, wait
 from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+from webnovels.catalog import get_chapter_catalog, get_library_catalog
+from webnovels.storage import PackedStore
 
 NOVELS_DIR = Path(__file__).parent / '.novels'
+CACHE_DIR = NOVELS_DIR / '.cache'
 WHITESPACE = set(' \n\t')
 
 def get_file_safe(text):
@@ -17,28 +26,30 @@ def get_novel_dir(novel_title):
         raise RuntimeError('No directory found')
 
 
-def create_new_novel(novel_title):
+def create_new_novel(novel_title, packed=False):
     novel_dir = NOVELS_DIR / get_file_safe(novel_title)
     (novel_dir / '.resources').mkdir(parents=True)
     (novel_dir / '.resources' / 'dictionary_ext.txt').touch()
     (novel_dir / '.resources' / 'word_swaps.json').touch()
 
-    (novel_dir / 'raw_html').mkdir(parents=True)
-    (novel_dir / 'raw_chapters').mkdir(parents=True)
-    (novel_dir / 'change_lists').mkdir(parents=True)
+    if packed:
+        PackedStore(novel_dir).close()
+    else:
+        (novel_dir / 'raw_html').mkdir(parents=True)
+        (novel_dir / 'raw_chapters').mkdir(parents=True)
+        (novel_dir / 'change_lists').mkdir(parents=True)
+        (novel_dir / 'change_journals').mkdir(parents=True)
 
     with open(novel_dir / 'metadata.json', 'w') as metadata:
         json.dump({'title': novel_title}, metadata, indent=2)
 
 
+def get_novel_summaries():
+    return get_library_catalog(NOVELS_DIR).summaries()
+
+
 def get_novel_titles():
-    titles = []
-    for novel_dir in NOVELS_DIR.glob('*'):
-        if (novel_dir / 'metadata.json').exists():
-            with open(novel_dir / 'metadata.json', 'r') as metadata:
-                metadata = json.load(metadata)
-            titles.append(metadata['title'])
-    return titles
+    return [summary['title'] for summary in get_novel_summaries()]
 
 
 def get_chapter_info(novel_title):
@@ -47,13 +58,11 @@ def get_chapter_info(novel_title):
     if not (novel_dir / 'metadata.json').exists():
         raise RuntimeError
 
-    with open(novel_dir / 'metadata.json', 'r') as metadata_file:
-        metadata = json.load(metadata_file)
-
-    if 'chapter_info' not in metadata:
+    chapter_info = get_chapter_catalog(novel_dir).chapter_info()
+    if not chapter_info:
         raise RuntimeError
 
-    return metadata['chapter_info']
+    return chapter_info
 
 
 def get_novel_chapter_titles(novel_title):
@@ -61,28 +70,136 @@ def get_novel_chapter_titles(novel_title):
 
 
 def get_chapter_index(novel_title, chapter_title):
-    index = next((info['name_index'] for info in get_chapter_info(novel_title) if info['chapter_title'] == chapter_title), None)
-    if index is None:
+    """ Get the name_index of the first chapter with the given title """
+    matches = get_chapter_catalog(get_novel_dir(novel_title)).by_title(chapter_title)
+    if not matches:
         raise RuntimeError(f"Could not find chapter '{chapter_title}' in novel '{novel_title}'")
-    return index
+    return matches[0]['name_index']
+
+
+def bounded_map(executor: Executor, fn: Callable[[Any], Any], items: Iterable,
+                max_pending: int) -> Iterator[tuple[int, Any]]:
+    """ Run fn on every item in the executor with at most max_pending calls submitted at once
+
+    Results are yielded as (position, result) pairs in completion order. Items are only pulled from the
+    iterable as earlier calls finish, so neither the inputs nor the results pile up in memory.
+    """
+    item_iter = enumerate(items)
+    pending = {}
+
+    def submit_next():
+        for i, item in item_iter:
+            pending[executor.submit(fn, item)] = i
+            return
+
+    for _ in range(max_pending):
+        submit_next()
+
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            i = pending.pop(future)
+            submit_next()
+            yield i, future.result()
+
+
+def iter_in_thread(iterable: Iterable, maxsize: int) -> Iterator:
+    """ Produce the items of an iterable on a background thread and hand them over through a bounded queue
+
+    The producer runs ahead of the consumer until maxsize items are waiting, then blocks, so memory stays
+    flat however long the iterable is. An exception raised by the producer is re-raised in the consumer.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(message):
+        while not stop.is_set():
+            try:
+                items.put(message, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(('item', item)):
+                    break
+            else:
+                put(('done', None))
+        except Exception as exc:
+            put(('error', exc))
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+    producer = threading.Thread(target=produce, name='producer', daemon=True)
+    producer.start()
+    try:
+        while True:
+            kind, value = items.get()
+            if kind == 'item':
+                yield value
+            elif kind == 'error':
+                raise value
+            else:
+                return
+    finally:
+        # Unblock the producer if the consumer stopped early
+        stop.set()
+        producer.join()
+
+
+class LineIndex:
+    """ The offset of the start of every line of a text, for converting between string and Tk indices
+
+    Conversions bisect the line starts, so they take O(log lines) however many are made. The index can be kept
+    in step with edits to the text with replace() rather than being rebuilt.
+    """
+
+    def __init__(self, text: str = ''):
+        self._starts = [0] + self._newline_ends(text)
+        self.length = len(text)
+
+    @staticmethod
+    def _newline_ends(text: str, offset: int = 0) -> list[int]:
+        ends = []
+        i = text.find('\n')
+        while i >= 0:
+            ends.append(offset + i + 1)
+            i = text.find('\n', i + 1)
+        return ends
+
+    def __len__(self):
+        """ The number of lines """
+        return len(self._starts)
+
+    def to_tk_index(self, index: int) -> str:
+        line = bisect.bisect_right(self._starts, index)
+        return f"{line}.{index - self._starts[line - 1]}"
+
+    def to_str_index(self, tk_index: str) -> int:
+        line_str, col_str = tk_index.split('.')
+        line = int(line_str)
+        if line > len(self._starts):
+            raise IndexError("Line number out of range.")
+        return self._starts[line - 1] + int(col_str)
+
+    def replace(self, start: int, end: int, text: str):
+        """ Update the index for the text between start and end being replaced """
+        delta = len(text) - (end - start)
+        # Lines starting inside the replaced text are gone, and those after it move
+        first = bisect.bisect_right(self._starts, start)
+        last = bisect.bisect_right(self._starts, end, lo=first)
+        moved = [line_start + delta for line_start in self._starts[last:]] if delta else self._starts[last:]
+        self._starts[first:] = self._newline_ends(text, start) + moved
+        self.length += delta
 
 
 def to_tk_index(text: str, index: int):
-    lines = text[:index].split('\n')
-    line_no = len(lines)
-    col_no = len(lines[-1])
-    return f"{line_no}.{col_no}"
+    return LineIndex(text[:index]).to_tk_index(index)
 
 
 def to_str_index(text: str, tk_index: str):
-    line_str, col_str = tk_index.split('.')
-    line = int(line_str)
-    col = int(col_str)
-
-    lines = text.split('\n')
-    if line > len(lines):
-        raise IndexError("Line number out of range.")
-
-    # Sum lengths of lines before the target one (including newline chars)
-    char_index = sum(len(ln) + 1 for ln in lines[:line - 1]) + col
-    return char_index
+    return LineIndex(text).to_str_index(tk_index)
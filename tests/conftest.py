@@ -0,0 +1,31 @@
+from concurrent.futures import wait
+
+import pytest
+
+from webnovels import editing, utils
+from webnovels.gui.backend import Backend
+from webnovels.scrapers import base_scraper
+
+
+def _stop_loading_base_dictionary():
+    """ Let a background load finish writing to the test's cache, so it can't write to the real one later """
+    futures = [future for future in (editing._base_suggestions, editing._base_dictionary) if future is not None]
+    for future in futures:
+        future.cancel()
+    wait(futures)
+    editing._base_dictionary = editing._base_suggestions = None
+
+
+@pytest.fixture
+def novels_dir(tmp_path, monkeypatch):
+    """ Keep the novels and caches created by a test in a temporary directory """
+    cache_dir = tmp_path / '.cache'
+    for module in (utils, editing, base_scraper):
+        monkeypatch.setattr(module, 'NOVELS_DIR', tmp_path)
+    monkeypatch.setattr(utils, 'CACHE_DIR', cache_dir)
+    monkeypatch.setattr(base_scraper, 'CACHE_DIR', cache_dir)
+    monkeypatch.setattr(editing, 'SPELLING_CACHE_DIR', cache_dir / 'spelling')
+    yield tmp_path
+
+    Backend._instance = None
+    _stop_loading_base_dictionary()
@@ -0,0 +1,28 @@
+from webnovels.gui.backend import Backend
+from webnovels.storage import get_chapter_store
+from webnovels.utils import create_new_novel, get_novel_dir
+
+
+def create_novel(novel_title, *texts):
+    create_new_novel(novel_title)
+    store = get_chapter_store(get_novel_dir(novel_title))
+    for i, text in enumerate(texts, start=1):
+        store.write('raw_chapters', i, text)
+
+
+def test_switching_novels_keeps_chapters_with_their_novel(novels_dir):
+    create_novel('First Novel', 'The first novel starts here.')
+    create_novel('Second Novel', 'The second novel starts here.')
+    backend = Backend()
+
+    backend.load_novel('First Novel')
+    backend.show_chapter('Chapter 1', backend.read_chapter('First Novel', 'Chapter 1', 1), [])
+    first_tracker = backend.edit_tracker
+
+    # The first novel's chapter is still shown until one from the second is picked
+    backend.load_novel('Second Novel')
+    assert backend.recall_chapter('Second Novel', 1) is None
+
+    backend.show_chapter('Chapter 1', backend.read_chapter('Second Novel', 'Chapter 1', 1), [])
+    assert backend.recall_chapter('First Novel', 1)[0] is first_tracker
+    assert backend.recall_chapter('Second Novel', 1)[0].processed_text == 'The second novel starts here.'
@@ -0,0 +1,45 @@
+from webnovels import catalog
+from webnovels.catalog import LibraryCatalog, get_chapter_catalog
+from webnovels.utils import create_new_novel, get_novel_dir
+
+
+def test_replace_all_keeps_word_counts_of_unchanged_chapters(novels_dir):
+    create_new_novel('Counted Novel')
+    chapter_catalog = get_chapter_catalog(get_novel_dir('Counted Novel'))
+    chapter_catalog.replace_all([{'name_index': i, 'url': f'/chapter-{i}', 'chapter_title': ''} for i in (1, 2, 3)])
+    chapter_catalog.set_parsed({1: ('One', 10), 2: ('Two', 20), 3: ('Three', 30)})
+
+    # Chapter 2 moved to another URL and chapter 3 is gone
+    chapter_catalog.replace_all([{'name_index': 1, 'url': '/chapter-1', 'chapter_title': 'One'},
+                                 {'name_index': 2, 'url': '/chapter-2b', 'chapter_title': ''}])
+
+    assert chapter_catalog.chapter_info() == [{'name_index': 1, 'url': '/chapter-1', 'chapter_title': 'One'},
+                                              {'name_index': 2, 'url': '/chapter-2b', 'chapter_title': ''}]
+    assert chapter_catalog.word_count() == 10
+
+
+def test_library_refresh_skips_unchanged_novels(novels_dir, monkeypatch):
+    create_new_novel('Listed Novel')
+    get_chapter_catalog(get_novel_dir('Listed Novel'))
+
+    def refresh_in_new_process():
+        # A new process opens each chapter catalog afresh, and closes it on exit
+        for chapter_catalog in catalog._catalogs.values():
+            chapter_catalog.close()
+        catalog._catalogs.clear()
+        LibraryCatalog(novels_dir).refresh()
+        for chapter_catalog in catalog._catalogs.values():
+            chapter_catalog.close()
+        catalog._catalogs.clear()
+
+    # Creating the catalog's tables reaches catalog.sqlite when the creating process closes it
+    refresh_in_new_process()
+    refresh_in_new_process()
+
+    summarise = LibraryCatalog._summarise
+    summarised = []
+    monkeypatch.setattr(LibraryCatalog, '_summarise',
+                        lambda self, novel_dir: summarised.append(novel_dir) or summarise(self, novel_dir))
+    refresh_in_new_process()
+    assert summarised == []
+    assert [summary['title'] for summary in LibraryCatalog(novels_dir).summaries()] == ['Listed Novel']
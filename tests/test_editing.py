@@ -0,0 +1,43 @@
+from webnovels.editing import EditTracker, _load_compiled
+from webnovels.storage import get_chapter_store
+from webnovels.utils import create_new_novel, get_novel_dir
+
+
+def test_journal_compaction_leaves_dead_space_to_compact(novels_dir, monkeypatch):
+    monkeypatch.setattr(EditTracker, 'SNAPSHOT_INTERVAL', 2)
+    monkeypatch.setattr(EditTracker, 'COMPACT_INTERVAL', 2)
+    create_new_novel('Packed Novel', packed=True)
+    store = get_chapter_store(get_novel_dir('Packed Novel'))
+    store.write('raw_chapters', 1, 'The quick brown fox jumps over the lazy dog.')
+
+    edit_tracker = EditTracker()
+    edit_tracker.load_chapter_index('Packed Novel', 1)
+    for word in ['red', 'green', 'blue', 'grey', 'black', 'white']:
+        edit_tracker.record_change(10, 10 + len(edit_tracker.text[10:].split()[0]), word)
+        edit_tracker.save()
+
+    # Each journal compaction replaces the journal's segments, which stay in the pack until it's compacted
+    assert store.dead_bytes > 0
+    size_before = store.pack_fp.stat().st_size
+    store.compact()
+    assert store.dead_bytes == 0
+    assert store.pack_fp.stat().st_size < size_before
+
+    reloaded = EditTracker()
+    reloaded.load_chapter_index('Packed Novel', 1)
+    assert reloaded.processed_text == 'The quick white fox jumps over the lazy dog.'
+    assert reloaded.history == edit_tracker.history
+
+
+def test_load_compiled_caches_build(tmp_path):
+    cache_fp = tmp_path / 'spelling' / 'words.pickle'
+    builds = []
+
+    def build():
+        builds.append(1)
+        return {'words': ['red', 'green']}
+
+    assert _load_compiled(cache_fp, build) == {'words': ['red', 'green']}
+    assert _load_compiled(cache_fp, build) == {'words': ['red', 'green']}
+    assert len(builds) == 1
+    assert [fp.name for fp in cache_fp.parent.iterdir()] == ['words.pickle']
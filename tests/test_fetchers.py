@@ -0,0 +1,173 @@
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from webnovels.scrapers.base_scraper import BaseScraper
+from webnovels.scrapers.fetchers import HttpFetcher, WebDriverFetcher, fetch_all
+from webnovels.scrapers.throttling import FetchError, RetryPolicy
+
+FAST_RETRY = RetryPolicy(max_attempts=4, base_delay=0.01)
+
+
+class ChapterHandler(BaseHTTPRequestHandler):
+    """ Serves /chapter-<n> pages, after failing the first requests for them if the query string asks it to
+
+    ?delay=<seconds> waits before answering, ?errors=<n> answers the first n requests with a 503 and
+    ?stalls=<n> doesn't answer the first n requests in time for the client.
+    """
+    STALL = 1.0
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        options = dict(option.split('=') for option in query.split('&') if option)
+        with self.server.lock:
+            self.server.requests[path] += 1
+            attempt = self.server.requests[path]
+
+        if not path.startswith('/chapter-'):
+            return self._respond(404, 'Not found')
+        if attempt <= int(options.get('stalls', 0)):
+            time.sleep(self.STALL)
+        elif attempt <= int(options.get('errors', 0)):
+            return self._respond(503, 'Busy')
+        time.sleep(float(options.get('delay', 0)))
+        self._respond(200, f"<p>{path.lstrip('/')}</p>")
+
+    def _respond(self, status, body):
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html')
+            self.end_headers()
+            self.wfile.write(body.encode('utf-8'))
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client timed out
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def chapter_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ChapterHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = Counter()
+    server.url = f'http://127.0.0.1:{server.server_port}/'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fetcher():
+    fetcher = HttpFetcher(pool_size=4, timeout=0.3)
+    yield fetcher
+    fetcher.close()
+
+
+class ServerScraper(BaseScraper):
+    INITIAL_REQUEST_RATE = MAX_REQUEST_RATE = 1000.0
+    RETRY_POLICY = FAST_RETRY
+
+    def create_fetcher(self):
+        return HttpFetcher(pool_size=4, timeout=0.3)
+
+    def create_cache(self):
+        return None
+
+
+@pytest.fixture
+def scraper(chapter_server, novels_dir):
+    scraper = ServerScraper(chapter_server.url, 'Served Novel')
+    yield scraper
+    scraper.close()
+
+
+def test_fetch_all_yields_results_by_position(chapter_server, fetcher):
+    # Earlier chapters take longer, so they finish out of order
+    urls = [f'{chapter_server.url}chapter-{i}?delay={0.05 * (6 - i)}' for i in range(1, 7)]
+    results = list(fetch_all(fetcher.fetch, urls, max_workers=4))
+
+    positions = [position for position, _ in results]
+    assert sorted(positions) == list(range(6))
+    assert positions != sorted(positions)
+    for position, result in results:
+        assert result.status == 200
+        assert result.text == f'<p>chapter-{position + 1}</p>'
+
+
+def test_fetch_all_retries_server_errors_and_timeouts(chapter_server, scraper):
+    urls = ['chapter-1?errors=2', 'chapter-2?stalls=1', 'chapter-3']
+    results = dict(scraper.fetch_all(urls))
+
+    assert results == {0: '<p>chapter-1</p>', 1: '<p>chapter-2</p>', 2: '<p>chapter-3</p>'}
+    assert chapter_server.requests == {'/chapter-1': 3, '/chapter-2': 2, '/chapter-3': 1}
+
+
+def test_fetch_all_gives_up_after_max_attempts(chapter_server, scraper):
+    results = list(fetch_all(scraper.get, ['chapter-1?errors=10'], retry=FAST_RETRY))
+
+    [(_, result)] = results
+    assert isinstance(result, FetchError)
+    assert result.status == 503
+    assert chapter_server.requests['/chapter-1'] == FAST_RETRY.max_attempts
+
+
+def test_error_statuses_raise_fetch_error(chapter_server, scraper):
+    with pytest.raises(FetchError) as exc_info:
+        scraper.get_page('missing')
+    assert exc_info.value.status == 404
+
+    # Client errors aren't worth retrying
+    with pytest.raises(FetchError):
+        list(scraper.fetch_all(['missing']))
+    assert chapter_server.requests['/missing'] == 2
+
+
+class FakeDriver:
+    def __init__(self):
+        self.quit_called = False
+
+    def quit(self):
+        self.quit_called = True
+
+
+@pytest.fixture
+def driver_fetcher(monkeypatch):
+    monkeypatch.setattr(WebDriverFetcher, '_create_driver', lambda self: FakeDriver())
+    return WebDriverFetcher(driver_path=None, pool_size=1)
+
+
+def test_driver_returns_to_pool_after_other_errors(driver_fetcher):
+    with pytest.raises(ValueError):
+        with driver_fetcher._checkout() as driver:
+            raise ValueError("Unexpected page")
+
+    with driver_fetcher._checkout() as same_driver:
+        assert same_driver is driver
+    assert not driver.quit_called
+
+
+def test_interrupted_driver_is_replaced_for_waiting_threads(driver_fetcher):
+    waiting_for = []
+
+    def wait_for_driver():
+        with driver_fetcher._checkout() as driver:
+            waiting_for.append(driver)
+
+    with pytest.raises(KeyboardInterrupt):
+        with driver_fetcher._checkout() as driver:
+            waiter = threading.Thread(target=wait_for_driver, daemon=True)
+            waiter.start()
+            time.sleep(0.05)
+            raise KeyboardInterrupt
+
+    waiter.join(timeout=1.0)
+    assert driver.quit_called
+    assert len(waiting_for) == 1 and waiting_for[0] is not driver
+    assert driver_fetcher._drivers == waiting_for
@@ -0,0 +1,37 @@
+import pytest
+
+from webnovels.gui.gui_components import ScrollableTextBox
+from webnovels.utils import LineIndex
+
+
+@pytest.fixture
+def text_box():
+    """ Just enough of a ScrollableTextBox to resolve edits, with plain string offsets as Tk indices """
+    text_box = ScrollableTextBox.__new__(ScrollableTextBox)
+    text_box._lines = LineIndex('0123456789')
+    text_box._offset = lambda tk_index, length: min(int(tk_index), length)
+    return text_box
+
+
+def apply(text, edits):
+    for start, end, new_text in edits:
+        text = text[:start] + new_text + text[end:]
+    return text
+
+
+def test_delete_merges_overlapping_ranges(text_box):
+    edits = text_box._resolve_edit('delete', ('2', '5', '4', '7', '8', '9'))
+
+    assert edits == [(8, 9, ''), (2, 7, '')]
+    assert apply('0123456789', edits) == '0179'
+
+
+def test_delete_merges_touching_and_out_of_order_ranges(text_box):
+    edits = text_box._resolve_edit('delete', ('5', '7', '1', '3', '3', '5', '9'))
+
+    assert edits == [(9, 10, ''), (1, 7, '')]
+    assert apply('0123456789', edits) == '078'
+
+
+def test_delete_ignores_empty_ranges(text_box):
+    assert text_box._resolve_edit('delete', ('6', '2', '4', '4')) == []
@@ -0,0 +1,150 @@
+from collections import Counter
+
+import pytest
+
+from webnovels.scrapers.base_scraper import BaseScraper
+from webnovels.scrapers.fetchers import BaseFetcher, FetchResult
+from webnovels.scrapers.manifest import ChapterManifest
+from webnovels.utils import get_novel_summaries
+
+NOVEL_URL = 'http://novel.test/novel/'
+CHAPTER_COUNT = 12
+
+
+class Crash(BaseException):
+    """ Stands in for the process dying, which per-chapter error handling mustn't swallow """
+
+
+class PageFetcher(BaseFetcher):
+    def __init__(self):
+        super().__init__()
+        self.fetched = Counter()
+
+    def fetch(self, url, headers=None):
+        self.fetched[url] += 1
+        return FetchResult(url, 200, url.rsplit('/', 1)[-1], {}, 0.0)
+
+
+class StubScraper(BaseScraper):
+    PARSE_WORKERS = 1
+    INITIAL_REQUEST_RATE = MAX_REQUEST_RATE = 1000.0
+    chapter_count = CHAPTER_COUNT
+    # Pages which fail to parse, and the parse to crash on
+    broken_pages = set()
+    crash_after = None
+    parse_count = 0
+
+    def create_fetcher(self):
+        return PageFetcher()
+
+    def create_cache(self):
+        return None
+
+    def get_chapters(self, known_chapters=None):
+        return [f'{NOVEL_URL}chapter-{i}' for i in range(1, self.chapter_count + 1)]
+
+    @classmethod
+    def parse_chapter(cls, chapter_html):
+        cls.parse_count += 1
+        if cls.crash_after is not None and cls.parse_count > cls.crash_after:
+            raise Crash()
+        if chapter_html in cls.broken_pages:
+            raise ValueError(f"No chapter content in {chapter_html}")
+        return chapter_html.title(), f"The text of {chapter_html}"
+
+
+class CachedStubScraper(StubScraper):
+    create_cache = BaseScraper.create_cache
+
+
+@pytest.fixture
+def scraper_cls(novels_dir, monkeypatch):
+    monkeypatch.setattr(StubScraper, 'chapter_count', CHAPTER_COUNT)
+    monkeypatch.setattr(StubScraper, 'broken_pages', set())
+    monkeypatch.setattr(StubScraper, 'crash_after', None)
+    monkeypatch.setattr(StubScraper, 'parse_count', 0)
+    return StubScraper
+
+
+def parsed_titles(scraper):
+    return {info['name_index']: info['chapter_title'] for info in scraper.catalog.chapter_info()
+            if scraper.store.exists('raw_chapters', info['name_index'])}
+
+
+def test_scrape_parses_chapters_left_by_interrupted_run(scraper_cls):
+    scraper_cls.crash_after = 3
+    scraper = scraper_cls(NOVEL_URL, 'Stub Novel')
+    with pytest.raises(Crash):
+        scraper.scrape()
+    scraper.close()
+
+    scraper = scraper_cls(NOVEL_URL, 'Stub Novel')
+    assert len(parsed_titles(scraper)) == 3
+    assert sum(scraper.store.exists('raw_html', i) for i in range(1, CHAPTER_COUNT + 1)) > 3
+
+    scraper_cls.crash_after = None
+    scraper.scrape()
+    titles = parsed_titles(scraper)
+    scraper.close()
+
+    assert titles == {i: f'Chapter-{i}' for i in range(1, CHAPTER_COUNT + 1)}
+
+
+def test_scrape_survives_parse_failures(scraper_cls):
+    scraper_cls.broken_pages = {'chapter-4', 'chapter-9'}
+    scraper = scraper_cls(NOVEL_URL, 'Stub Novel')
+    scraper.scrape()
+    titles = parsed_titles(scraper)
+    scraper.close()
+
+    assert sorted(titles) == [i for i in range(1, CHAPTER_COUNT + 1) if i not in (4, 9)]
+
+    # Broken chapters are downloaded and parsed again by the next scrape
+    manifest = ChapterManifest(scraper.novel_dir)
+    assert manifest.get(f'{NOVEL_URL}chapter-4')['status'] == 'failed'
+    assert manifest.get(f'{NOVEL_URL}chapter-9')['status'] == 'failed'
+
+    scraper_cls.broken_pages = set()
+    scraper = scraper_cls(NOVEL_URL, 'Stub Novel')
+    scraper.scrape()
+    assert len(parsed_titles(scraper)) == CHAPTER_COUNT
+    scraper.close()
+
+
+def test_scraping_new_chapters_keeps_word_counts(scraper_cls):
+    scraper = scraper_cls(NOVEL_URL, 'Stub Novel')
+    scraper.scrape()
+    scraper.close()
+    # Each chapter's text is 'The text of chapter-<n>'
+    assert get_novel_summaries()[0]['word_count'] == 4 * CHAPTER_COUNT
+
+    scraper_cls.chapter_count = CHAPTER_COUNT + 2
+    scraper = scraper_cls(NOVEL_URL, 'Stub Novel')
+    scraper.scrape()
+    scraper.close()
+
+    assert scraper_cls.parse_count == CHAPTER_COUNT + 2
+    assert scraper.catalog.word_count() == 4 * (CHAPTER_COUNT + 2)
+    [summary] = get_novel_summaries()
+    assert summary['chapter_count'] == CHAPTER_COUNT + 2
+    assert summary['word_count'] == 4 * (CHAPTER_COUNT + 2)
+
+
+def test_failed_and_forced_downloads_bypass_cache(scraper_cls):
+    scraper_cls.broken_pages = {'chapter-4'}
+    scraper = CachedStubScraper(NOVEL_URL, 'Stub Novel')
+    scraper.scrape()
+    scraper.close()
+    assert scraper.cache.stats()['entries'] == CHAPTER_COUNT
+
+    # The chapter which failed to parse is fetched from the site again, the rest are left alone
+    scraper_cls.broken_pages = set()
+    scraper = CachedStubScraper(NOVEL_URL, 'Stub Novel')
+    scraper.scrape()
+    assert scraper.fetcher.fetched == {f'{NOVEL_URL}chapter-4': 1}
+    assert len(parsed_titles(scraper)) == CHAPTER_COUNT
+
+    scraper.scrape(force=True)
+    assert sum(scraper.fetcher.fetched.values()) == 1 + CHAPTER_COUNT
+    assert scraper.cache.stats()['hits'] == 0
+    scraper.close()
@@ -0,0 +1,87 @@
+import os
+
+from webnovels.storage import DirectoryStore, PackedStore
+
+
+def random_text(size):
+    # Hex of random bytes doesn't compress much, so rewrites leave a measurable amount of dead space
+    return os.urandom(size // 2).hex()
+
+
+def test_compact_shrinks_pack_and_keeps_documents(tmp_path):
+    store = PackedStore(tmp_path)
+    expected = {}
+    for chapter_idx in range(1, 21):
+        for _ in range(3):
+            expected['raw_html', chapter_idx] = random_text(4000)
+            store.write('raw_html', chapter_idx, expected['raw_html', chapter_idx])
+        expected['change_journals', chapter_idx] = ''
+        for line in range(5):
+            expected['change_journals', chapter_idx] += f'{{"line": {line}}}\n'
+            store.append('change_journals', chapter_idx, f'{{"line": {line}}}\n')
+
+    size_before = store.pack_fp.stat().st_size
+    assert store.dead_bytes > 0
+    store.compact()
+
+    assert store.pack_fp.stat().st_size < size_before
+    assert store.dead_bytes == 0
+    for (kind, chapter_idx), text in expected.items():
+        assert store.read(kind, chapter_idx) == text
+        assert store.size(kind, chapter_idx) == len(text.encode('utf-8'))
+
+    # The rewritten index must load back to the same documents
+    store.close()
+    reopened = PackedStore(tmp_path)
+    for (kind, chapter_idx), text in expected.items():
+        assert reopened.read(kind, chapter_idx) == text
+
+
+def test_maybe_compact_waits_for_enough_dead_space(tmp_path, monkeypatch):
+    monkeypatch.setattr(PackedStore, 'COMPACT_MIN_DEAD_BYTES', 6000)
+    store = PackedStore(tmp_path)
+    texts = {1: random_text(8000), 2: random_text(8000)}
+    for chapter_idx, text in texts.items():
+        store.write('raw_chapters', chapter_idx, text)
+    assert not store.maybe_compact()
+
+    # One replaced document is too little dead space, replacing both leaves half the pack dead
+    store.write('raw_chapters', 1, texts[1])
+    assert not store.maybe_compact()
+    store.write('raw_chapters', 2, texts[2])
+    size_before = store.pack_fp.stat().st_size
+    assert store.maybe_compact()
+
+    assert store.pack_fp.stat().st_size * 2 == size_before
+    for chapter_idx, text in texts.items():
+        assert store.read('raw_chapters', chapter_idx) == text
+
+
+def test_close_leaves_compaction_to_be_asked_for(tmp_path, monkeypatch):
+    monkeypatch.setattr(PackedStore, 'COMPACT_MIN_DEAD_BYTES', 0)
+    store = PackedStore(tmp_path)
+    for _ in range(4):
+        store.write('raw_html', 1, random_text(2000))
+    text = random_text(2000)
+    store.write('raw_html', 1, text)
+    dead_bytes = store.dead_bytes
+    store.close()
+
+    # Another process may still be reading the pack at its old offsets
+    assert PackedStore(tmp_path).dead_bytes == dead_bytes > 0
+    assert PackedStore(tmp_path).read('raw_html', 1) == text
+
+
+def test_stores_agree_on_sizes(tmp_path):
+    text = 'Caf\u00e9 \u201cquoted\u201d\r\nnext line\n'
+    directory_store = DirectoryStore(tmp_path)
+    (tmp_path / 'packed').mkdir()
+    packed_store = PackedStore(tmp_path / 'packed')
+
+    assert directory_store.write('raw_html', 1, text) == len(text.encode('utf-8'))
+    assert packed_store.write('raw_html', 1, text) == len(text.encode('utf-8'))
+    assert directory_store.size('raw_html', 1) == packed_store.size('raw_html', 1)
+
+    directory_store.append('change_journals', 1, text)
+    packed_store.append('change_journals', 1, text)
+    assert directory_store.size('change_journals', 1) == packed_store.size('change_journals', 1)
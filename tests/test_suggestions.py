@@ -0,0 +1,49 @@
+import random
+
+import pytest
+
+from webnovels.suggestions import CompiledDeletionIndex, DeletionIndex, deletes, edit_distance
+
+WORDS = [
+    'a', 'I', 'an', 'at', 'be', 'by', 'ox', 'to', 'act', 'cat', 'cart', 'tack', 'their', 'there', 'three',
+    'sword', 'words', 'swordsman', 'character', 'characters', 'cultivation', 'extraordinary', 'extraordinarily',
+]
+
+
+def queries():
+    """ Every word, and words one or two random edits away from them """
+    rng = random.Random(16)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    found = {'', 'x', 'xy', 'tx', 'ca'}
+    for word in WORDS:
+        found.add(word)
+        for _ in range(20):
+            query = word
+            for _ in range(rng.randint(1, 2)):
+                i = rng.randrange(len(query) + 1)
+                edit = rng.choice(['insert', 'delete', 'replace', 'swap'])
+                if edit == 'insert':
+                    query = query[:i] + rng.choice(letters) + query[i:]
+                elif edit == 'delete':
+                    query = query[:i] + query[i + 1:]
+                elif edit == 'replace':
+                    query = query[:i] + rng.choice(letters) + query[i + 1:]
+                else:
+                    query = query[:i] + query[i + 1:i + 2] + query[i:i + 1] + query[i + 2:]
+            found.add(query)
+    return sorted(found)
+
+
+def test_short_words_delete_to_empty_string():
+    assert deletes('a', max_distance=2) == {'a': 0, '': 1}
+    assert deletes('ox', max_distance=2) == {'ox': 0, 'o': 1, 'x': 1, '': 2}
+    assert '' not in deletes('cat', max_distance=2)
+
+
+@pytest.mark.parametrize('index_cls', [DeletionIndex, CompiledDeletionIndex.build])
+@pytest.mark.parametrize('max_distance', [1, 2])
+def test_lookup_finds_every_word_within_distance(index_cls, max_distance):
+    index = index_cls(WORDS)
+    for query in queries():
+        expected = {word for word in WORDS if edit_distance(query, word, max_distance) <= max_distance}
+        assert expected <= index.lookup(query, max_distance), query
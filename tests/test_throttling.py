@@ -0,0 +1,94 @@
+import threading
+
+import pytest
+
+from webnovels.scrapers import throttling
+from webnovels.scrapers.throttling import HostThrottle
+
+
+class FakeClock:
+    """ Stands in for the time module in throttling, so time only passes when a test says so """
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(throttling, 'time', clock)
+    return clock
+
+
+def request(throttle, clock, elapsed=0.1, status=200, retry_after=None):
+    # Long enough for a token at the rates used here, so acquire() never waits
+    clock.advance(10.0)
+    throttle.acquire()
+    throttle.release(elapsed, status, retry_after)
+
+
+def test_fast_responses_increase_rate_and_concurrency_step_by_step(clock):
+    throttle = HostThrottle('site.test', rate=2.0, max_rate=2.5, max_concurrency=3)
+
+    rates, concurrencies = [], []
+    for _ in range(6):
+        request(throttle, clock)
+        rates.append(round(throttle.rate, 6))
+        concurrencies.append(throttle.concurrency)
+
+    assert rates == [2.1, 2.2, 2.3, 2.4, 2.5, 2.5]
+    # One more request in flight after as many fast responses in a row as are currently allowed
+    assert concurrencies == [2, 2, 3, 3, 3, 3]
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_throttled_responses_back_off(clock, status):
+    throttle = HostThrottle('site.test', rate=8.0, max_concurrency=4)
+    for _ in range(6):
+        request(throttle, clock)
+    assert throttle.concurrency == 4
+
+    request(throttle, clock, status=status)
+    assert throttle.rate == pytest.approx(8.6 * HostThrottle.BACKOFF_FACTOR)
+    assert throttle.concurrency == 2
+
+    request(throttle, clock, status=status)
+    assert throttle.rate == pytest.approx(8.6 * HostThrottle.BACKOFF_FACTOR ** 2)
+    assert throttle.concurrency == 1
+
+    # Recovery is additive again
+    request(throttle, clock)
+    assert throttle.rate == pytest.approx(8.6 * HostThrottle.BACKOFF_FACTOR ** 2 + HostThrottle.RATE_STEP)
+    assert throttle.concurrency == 2
+
+
+def test_failures_and_slow_responses_slow_down(clock):
+    throttle = HostThrottle('site.test', rate=4.0, min_rate=0.5, slow_response=10.0)
+
+    request(throttle, clock, elapsed=12.0)
+    assert throttle.rate == pytest.approx(4.0 * HostThrottle.SLOW_FACTOR)
+
+    for _ in range(5):
+        request(throttle, clock, elapsed=None, status=None)
+    assert throttle.rate == 0.5
+    assert throttle.concurrency == 1
+
+
+def test_retry_after_blocks_requests(clock):
+    throttle = HostThrottle('site.test', rate=100.0)
+    request(throttle, clock, status=503, retry_after=30.0)
+
+    # Just short of the wait, so acquire() polls the fake clock every few real milliseconds
+    clock.advance(29.95)
+    acquired = threading.Event()
+    thread = threading.Thread(target=lambda: (throttle.acquire(), acquired.set()), daemon=True)
+    thread.start()
+    assert not acquired.wait(0.2)
+
+    clock.advance(0.1)
+    assert acquired.wait(1.0)